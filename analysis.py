@@ -0,0 +1,190 @@
+"""
+Flyby analysis of a sweep of voyager runs: where each run passed each
+planet, computed with array operations over all of them at once.
+"""
+
+import numpy as np
+import pandas as pd
+from modsim import SweepFrame
+from gravity import body_positions, body_states
+
+# bisection steps when refining the time of closest approach; each one
+# halves an interval that starts as one sample spacing
+REFINE_STEPS = 40
+
+
+def _hermite(t0, t1, start, end, t):
+	"""Cubic Hermite interpolation of a projectile between two samples.
+
+	t0, t1: arrays (n,) of sample times
+	start, end: arrays (n, 4) of x, y, vx, vy at t0 and t1
+	t: array (n,) of times between t0 and t1
+
+	returns: array (n, 4) of x, y, vx, vy at t
+	"""
+	h = (t1 - t0)[:, None]
+	s = ((t - t0) / (t1 - t0))[:, None]
+	p0, v0 = start[:, :2], start[:, 2:]
+	p1, v1 = end[:, :2], end[:, 2:]
+
+	position = ((2*s**3 - 3*s**2 + 1) * p0 + (s**3 - 2*s**2 + s) * h * v0 +
+				(-2*s**3 + 3*s**2) * p1 + (s**3 - s**2) * h * v1)
+	velocity = ((6*s**2 - 6*s) / h * p0 + (3*s**2 - 4*s + 1) * v0 +
+				(-6*s**2 + 6*s) / h * p1 + (3*s**2 - 2*s) * v1)
+	return np.concatenate([position, velocity], axis=1)
+
+
+def _relative(body_ephemerides, bi, t0, t1, start, end, t):
+	"""State of the projectile relative to body `bi` at `t`, for each pair."""
+	relative = _hermite(t0, t1, start, end, t)
+	for b, ephemeris in enumerate(body_ephemerides):
+		mask = bi == b
+		if mask.any():
+			relative[mask] -= ephemeris(t[mask])
+	return relative
+
+
+def _radial(relative):
+	"""Rate of change of the squared distance, over 2."""
+	return np.einsum('ij,ij->i', relative[:, :2], relative[:, 2:])
+
+
+def flyby_analysis(runs, bodies, G, max_elements=2**23):
+	"""Closest approach of every run to every body.
+
+	The closest sample of each run to each body is found with array
+	operations over runs x bodies x samples. The time of closest approach
+	is then refined between samples by bisection on the rate of change
+	of the distance, with the projectile interpolated from its sampled
+	positions and velocities and the body looked up on its ephemeris.
+	The deflection angle is that of the two-body hyperbola with the same
+	closest distance and relative speed, 2 * arcsin(1 / e), and NaN when
+	the relative speed is too low for a hyperbola. For a run that hit a
+	body (see run_trajectory), the closest approach to that body is the
+	impact, with NaN speed and deflection.
+
+	runs: list of body dictionaries with positions (x, y, vx and vy), as
+		made by sweep_voyager; runs over the same `ts` share the body
+		lookups, while runs with their own sample times (see
+		modsim.adaptive_times) are each looked up at theirs
+	bodies: list of body dictionaries to measure the runs against
+	G: gravitational constant
+	max_elements: how many run x body x sample values to work on at
+		once, which bounds the memory used
+
+	returns: SweepFrame indexed by (run, body) with columns distance
+		(from the center), altitude (from the surface), t, speed (relative
+		to the body) and deflection (in radians)
+	"""
+	frames = [body_positions(run) for run in runs]
+	num_runs = len(runs)
+	num_samples = max(len(frame) for frame in frames)
+
+	# sample times of each run, padded with NaN after the run ends
+	states = np.full((num_runs, num_samples, 4), np.nan)
+	times = np.full((num_runs, num_samples), np.nan)
+	lengths = np.empty(num_runs, dtype=np.intp)
+	for i, frame in enumerate(frames):
+		states[i, :len(frame)] = frame[['x', 'y', 'vx', 'vy']].values
+		times[i, :len(frame)] = np.asarray(frame.index, dtype=np.float64)
+		lengths[i] = len(frame)
+
+	# runs over the same `ts` share their sample times, so the bodies only
+	# need to be looked up once for all of them
+	grid = times[np.argmax(lengths)]
+	shared = all(np.array_equal(times[i, :lengths[i]], grid[:lengths[i]]) for i in range(num_runs))
+
+	ephemerides = [body_states(body) for body in bodies]
+	if shared:
+		body_grid = np.stack([ephemeris(grid) for ephemeris in ephemerides])
+	mu = G * np.array([body['mass'] for body in bodies], dtype=np.float64)
+	radius = np.array([body['radius'] for body in bodies], dtype=np.float64)
+
+	def body_samples(rows):
+		"""States of every body at the sample times of some runs.
+
+		returns: array (len(rows), bodies, samples, 4)
+		"""
+		if shared:
+			return np.broadcast_to(body_grid, (len(rows),) + body_grid.shape)
+		padded = np.where(np.isnan(times[rows]), grid[0], times[rows])
+		return np.stack([ephemeris(padded) for ephemeris in ephemerides], axis=1)
+
+	num_bodies = len(bodies)
+	closest = np.empty((num_runs, num_bodies), dtype=np.intp)
+	chunk_rows = max(1, max_elements // max(1, num_bodies * num_samples))
+	for start in range(0, num_runs, chunk_rows):
+		rows = np.arange(start, min(start + chunk_rows, num_runs))
+		chunk = states[rows]
+		samples = body_samples(rows)
+		dx = chunk[:, None, :, 0] - samples[..., 0]
+		dy = chunk[:, None, :, 1] - samples[..., 1]
+		distance2 = dx * dx + dy * dy
+		distance2[np.isnan(distance2)] = np.inf
+		closest[rows] = np.argmin(distance2, axis=-1)
+
+	# one row per (run, body) pair from here on
+	ri, bi = np.divmod(np.arange(num_runs * num_bodies), num_bodies)
+	k = closest.ravel()
+	t = times[ri, k]
+	relative = states[ri, k]
+	for b, ephemeris in enumerate(ephemerides):
+		mask = bi == b
+		relative[mask] -= ephemeris(t[mask])
+
+	# the closest approach is between sample k and whichever neighbor
+	# the projectile is moving towards
+	first = np.where(_radial(relative) < 0, k, k - 1)
+	refine = (first >= 0) & (first + 1 < lengths[ri])
+
+	if refine.any():
+		j, r, b = first[refine], ri[refine], bi[refine]
+		t0, t1 = times[r, j], times[r, j + 1]
+		start, end = states[r, j], states[r, j + 1]
+
+		radial0 = _radial(_relative(ephemerides, b, t0, t1, start, end, t0))
+		radial1 = _radial(_relative(ephemerides, b, t0, t1, start, end, t1))
+		bracketed = (radial0 <= 0) & (radial1 >= 0)
+
+		low, high = t0.copy(), t1.copy()
+		for _ in range(REFINE_STEPS):
+			mid = (low + high) / 2
+			approaching = _radial(_relative(ephemerides, b, t0, t1, start, end, mid)) < 0
+			low = np.where(approaching, mid, low)
+			high = np.where(approaching, high, mid)
+
+		t_refined = (low + high) / 2
+		refined = _relative(ephemerides, b, t0, t1, start, end, t_refined)
+
+		which = np.flatnonzero(refine)[bracketed]
+		t[which] = t_refined[bracketed]
+		relative[which] = refined[bracketed]
+
+	distance = np.hypot(relative[:, 0], relative[:, 1])
+	speed = np.hypot(relative[:, 2], relative[:, 3])
+
+	# a run that stopped at an impact reached the surface between samples
+	names = [body['name'] for body in bodies]
+	for i, run in enumerate(runs):
+		impact = run.get('impact')
+		if impact is not None and impact['body'] in names:
+			pair = i * num_bodies + names.index(impact['body'])
+			distance[pair] = radius[bi[pair]]
+			t[pair] = impact['t']
+			speed[pair] = np.nan
+
+	# two-body hyperbola with the same closest approach
+	mu_pairs = mu[bi]
+	v_inf2 = speed**2 - 2 * mu_pairs / distance
+	with np.errstate(invalid='ignore', divide='ignore'):
+		eccentricity = 1 + distance * v_inf2 / mu_pairs
+		deflection = np.where(v_inf2 > 0, 2 * np.arcsin(1 / eccentricity), np.nan)
+
+	index = pd.MultiIndex.from_arrays([ri, [names[b] for b in bi]], names=['run', 'body'])
+	return SweepFrame({
+		"distance": distance,
+		"altitude": distance - radius[bi],
+		"t": t,
+		"speed": speed,
+		"deflection": deflection,
+	}, index=index)
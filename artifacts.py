@@ -0,0 +1,268 @@
+"""
+On-disk format for lists of bodies (planets, voyager runs).
+
+A file is a small JSON header followed by raw float64 arrays:
+
+	magic          8 bytes, b'VOYAGER\0'
+	header length  8 bytes, little-endian unsigned
+	header         JSON, padded with spaces to a multiple of 64 bytes
+	arrays         each one starting on a multiple of 64 bytes
+
+The header records the format version and, for every body, its scalar
+fields (name, mass, radius, ...) and where each of its arrays is. Loading
+memory-maps the file and hands out bodies whose trajectories and
+interpolators are only built when first used, as views of the mapped
+arrays, so opening a file costs almost nothing and a large sweep doesn't
+have to fit in memory.
+"""
+
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from scipy.interpolate import interp1d
+from modsim import TimeFrame
+from ephemeris import ChebyshevEphemeris, HermiteEphemeris, KeplerEphemeris, KeplerOrbits, is_uniform
+
+MAGIC = b'VOYAGER\0'
+VERSION = 1
+ALIGNMENT = 64
+
+# body keys that are stored as arrays, or rebuilt from them
+ARRAY_KEYS = ('positions', 'position_interpolations', 'ephemeris')
+
+
+def _align(n):
+	return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def _jsonable(value):
+	if isinstance(value, dict):
+		return {key: _jsonable(val) for key, val in value.items()}
+	if isinstance(value, (np.floating, np.integer, np.bool_)):
+		return value.item()
+	return value
+
+
+def save_bodies(filepath, bodies):
+	"""Writes a list of body dictionaries.
+
+	A body is stored either by its sampled `positions` (each column and
+	the time index as its own array), for compressed bodies by its
+	ChebyshevEphemeris coefficients, or for Keplerian bodies by their
+	orbital elements alone. Any other keys must be JSON serializable.
+
+	filepath: string
+	bodies: list of body dictionaries
+	"""
+	arrays = []
+	entries = []
+
+	def add(array):
+		arrays.append(np.ascontiguousarray(array, dtype=np.float64))
+		return len(arrays) - 1
+
+	for body in bodies:
+		entry = {
+			"fields": {key: _jsonable(value) for key, value in body.items() if key not in ARRAY_KEYS},
+		}
+
+		if 'positions' in body:
+			positions = body['positions']
+			entry["kind"] = "samples"
+			entry["index"] = add(positions.index)
+			entry["columns"] = {column: add(positions[column].values) for column in positions.columns}
+		elif isinstance(body['ephemeris'], KeplerEphemeris):
+			ephemeris = body['ephemeris']
+			times = ephemeris._index
+			entry["kind"] = "kepler"
+			entry["elements"] = ephemeris.orbits.elements(ephemeris.index)
+			if isinstance(times, tuple):
+				entry["sample_times"] = [float(times[0]), float(times[1]), int(times[2])]
+			else:
+				entry["sample_times"] = add(times)
+
+		else:
+			ephemeris = body['ephemeris']
+			times = ephemeris._index
+			entry["kind"] = "chebyshev"
+			entry["t0"] = ephemeris.t0
+			entry["span"] = ephemeris.span
+			entry["max_error"] = float(ephemeris.max_error)
+			entry["max_speed"] = float(ephemeris.max_speed)
+			entry["coefficients"] = add(ephemeris.coefficients)
+			if isinstance(times, tuple):
+				entry["sample_times"] = [float(times[0]), float(times[1]), int(times[2])]
+			else:
+				entry["sample_times"] = add(times)
+
+		entries.append(entry)
+
+	# lay out the arrays after the header, each on an aligned offset
+	blocks = []
+	offset = 0
+	for array in arrays:
+		blocks.append({"offset": offset, "shape": list(array.shape)})
+		offset = _align(offset + array.nbytes)
+
+	header = {"version": VERSION, "blocks": blocks, "bodies": entries}
+	encoded = json.dumps(header).encode('utf-8')
+	encoded += b' ' * (_align(len(MAGIC) + 8 + len(encoded)) - len(MAGIC) - 8 - len(encoded))
+	data_start = len(MAGIC) + 8 + len(encoded)
+
+	# write to a temporary file first and move it into place, so a reader
+	# that has the old file mapped keeps it, instead of seeing it truncated
+	temporary = f'{filepath}.{os.getpid()}.tmp'
+	try:
+		with open(temporary, 'wb') as file_handle:
+			file_handle.write(MAGIC)
+			file_handle.write(struct.pack('<Q', len(encoded)))
+			file_handle.write(encoded)
+			for block, array in zip(blocks, arrays):
+				file_handle.seek(data_start + block["offset"])
+				file_handle.write(array.tobytes())
+		os.replace(temporary, filepath)
+	except BaseException:
+		if os.path.exists(temporary):
+			os.remove(temporary)
+		raise
+
+
+class MappedBody(dict):
+	"""
+	A body dictionary loaded by load_bodies.
+
+	The scalar fields are ordinary items. `positions`,
+	`position_interpolations` and `ephemeris` are built from the mapped
+	arrays the first time they are looked up, and then kept.
+	"""
+
+	def __init__(self, fields, entry, array):
+		super().__init__(fields)
+		self._entry = entry
+		self._array = array
+
+	def _lazy_keys(self):
+		if self._entry["kind"] == "samples":
+			return ('positions', 'position_interpolations')
+		return ('ephemeris', 'position_interpolations')
+
+	def __contains__(self, key):
+		return super().__contains__(key) or key in self._lazy_keys()
+
+	def keys(self):
+		return list(super().keys()) + [key for key in self._lazy_keys() if not dict.__contains__(self, key)]
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+	def __missing__(self, key):
+		if key not in self._lazy_keys():
+			raise KeyError(key)
+
+		entry = self._entry
+		if key == 'positions':
+			columns = {column: self._array(block) for column, block in entry["columns"].items()}
+			value = TimeFrame(columns, index=self._array(entry["index"]))
+
+		elif key == 'ephemeris' and entry["kind"] == "kepler":
+			times = entry["sample_times"]
+			times = tuple(times) if isinstance(times, list) else self._array(times)
+			orbits, index = entry["orbit"]
+			value = KeplerEphemeris(orbits, index, times)
+
+		elif key == 'ephemeris':
+			times = entry["sample_times"]
+			times = tuple(times) if isinstance(times, list) else self._array(times)
+			value = ChebyshevEphemeris(entry["t0"], entry["span"], self._array(entry["coefficients"]),
+									   entry["max_error"], entry["max_speed"], times)
+
+		elif entry["kind"] == "samples":
+			columns = entry["columns"]
+			velocities = {}
+			if 'vx' in columns and 'vy' in columns:
+				velocities = {"vx": self._array(columns["vx"]), "vy": self._array(columns["vy"])}
+			value = sample_interpolations(
+				self._array(entry["index"]),
+				self._array(columns["x"]),
+				self._array(columns["y"]),
+				hold=self.get('impact') is not None,
+				**velocities)
+
+		else:
+			value = self['ephemeris'].interpolations()
+
+		self[key] = value
+		return value
+
+
+def sample_interpolations(index, x, y, hold=False, vx=None, vy=None):
+	"""Position interpolators that share the given arrays instead of
+	copying them.
+
+	Samples that aren't evenly spaced in time (see modsim.adaptive_times)
+	are interpolated with a HermiteEphemeris when their velocities are
+	given, and linearly otherwise.
+
+	index, x, y: arrays of the same length
+	hold: whether to hold the first and last positions outside the
+		sampled range (for runs that stopped at an impact, as in
+		main.voyager_body) instead of extrapolating
+	vx, vy: optional arrays of velocities
+
+	returns: dictionary with x and y functions
+	"""
+	if vx is not None and len(index) > 1 and not is_uniform(index):
+		return HermiteEphemeris(index, np.column_stack([x, y]), np.column_stack([vx, vy]), hold=hold).interpolations()
+
+	def make(values):
+		options = dict(fill_value='extrapolate')
+		if hold:
+			options = dict(bounds_error=False, fill_value=(values[0], values[-1]))
+		return interp1d(index, values, copy=False, assume_sorted=True, **options)
+
+	return {"x": make(x), "y": make(y)}
+
+
+def load_bodies(filepath):
+	"""Memory-maps a file written by save_bodies.
+
+	filepath: string
+
+	returns: list of MappedBody
+	"""
+	with open(filepath, 'rb') as file_handle:
+		if file_handle.read(len(MAGIC)) != MAGIC:
+			raise ValueError(f'{filepath} is not a body artifact file')
+		length, = struct.unpack('<Q', file_handle.read(8))
+		header = json.loads(file_handle.read(length).decode('utf-8'))
+
+		if header["version"] != VERSION:
+			msg = f"""{filepath} was written with version {header["version"]}
+					 of the artifact format, but this is version {VERSION}."""
+			raise ValueError(msg)
+
+		data_start = len(MAGIC) + 8 + length
+		if header["blocks"]:
+			mapped = np.frombuffer(mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ), dtype=np.uint8)
+
+	blocks = header["blocks"]
+
+	def array(i):
+		block = blocks[i]
+		start = data_start + block["offset"]
+		count = int(np.prod(block["shape"]))
+		return mapped[start:start + 8 * count].view(np.float64).reshape(block["shape"])
+
+	# Keplerian bodies share one KeplerOrbits, so they are evaluated together
+	kepler = [entry for entry in header["bodies"] if entry["kind"] == "kepler"]
+	if kepler:
+		orbits = KeplerOrbits.from_elements([entry["elements"] for entry in kepler])
+		for index, entry in enumerate(kepler):
+			entry["orbit"] = (orbits, index)
+
+	return [MappedBody(entry["fields"], entry, array) for entry in header["bodies"]]
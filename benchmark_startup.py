@@ -0,0 +1,54 @@
+"""
+Measures how long it takes a fresh interpreter to import our modules,
+which is what every pool worker and command-line run pays before doing
+any work.
+
+Each import runs in its own new process (so nothing is already cached in
+sys.modules), several times, and the best time is reported along with
+the heavy packages the import pulled in. scipy.optimize shows up for
+every module that runs simulations, since scipy.integrate imports it.
+"""
+
+import subprocess
+import sys
+
+repeat = 5
+
+imports = [
+	'numpy',
+	'modsim',
+	'gravity',
+	'sweep',
+	'cache, artifacts',
+	'modsim_plot',
+]
+
+heavy = ['matplotlib', 'seaborn', 'sympy', 'pint', 'astropy', 'scipy.optimize']
+
+script = '''
+import sys, time
+start = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(' '.join(name for name in {heavy!r} if name in sys.modules))
+'''
+
+def cold_import(modules):
+	"""Imports `modules` in a new interpreter.
+
+	modules: comma separated module names, as in an import statement
+
+	returns: seconds the import took, list of heavy packages it loaded
+	"""
+	output = subprocess.run([sys.executable, '-c', script.format(modules=modules, heavy=heavy)],
+							check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+	elapsed, loaded = output.split('\n')[:2]
+	return float(elapsed), loaded.split()
+
+for modules in imports:
+	times = []
+	for _ in range(repeat):
+		elapsed, loaded = cold_import(modules)
+		times.append(elapsed)
+	print(f'import {modules}: {min(times) * 1000:.0f} ms (loads {", ".join(loaded) or "nothing heavy"})')
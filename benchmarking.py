@@ -1,103 +1,283 @@
-from modsim import *
-from timeit import timeit
-from pdb import set_trace
+"""
+Benchmarks for the simulation pipeline, with baselines to catch
+performance regressions.
 
-setup = '''
-import pickle
-from modsim import System, linspace, TimeFrame, State, Vector, interpolate
+The benchmarks make their own synthetic solar system (planets on circular
+orbits), so they don't need anything in build/ and give the same work on
+every run:
 
-with open('build/planets.pickle', 'rb') as file_handle:
-	planets = pickle.load(file_handle)
-'''
+$ python benchmarking.py                 # compares with the saved baseline
+$ python benchmarking.py save            # saves the results as the baseline
+$ python benchmarking.py threshold=0.1   # fails on anything 10% slower than its baseline
+$ python benchmarking.py only=slope,trajectory repeat=10
 
-num = 10000
-print(timeit("planets[0]['position_interpolations']", setup=setup, number=num)/num)
+Each benchmark is run once under tracemalloc, for the peak memory it
+allocates (which also warms it up), then `repeat` times, and the best
+time is kept. Throughput is the number of items (slope evaluations,
+frames, ...) per second of that time. The script exits with status 1 if
+any benchmark is slower than its baseline by more than the threshold.
+"""
 
-setup = '''
-from modsim import System, linspace, TimeFrame, State, Vector, interpolate
-import numpy as np
-import matplotlib
-import matplotlib.animation as animation
+import json
+import os
 import platform
 import sys
-import pickle
-from astropy.time import Time
-from astropy.coordinates import get_body
-from pdb import set_trace
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from modsim import State, System, TimeFrame, linspace
+from gravity import body_table, projectile_slope_func, run_trajectory
+from sweep import run_ensemble
+from artifacts import load_bodies, sample_interpolations, save_bodies
+from render import frame_positions, make_animation
 
-with open('build/planets.pickle', 'rb') as file_handle:
-	planets = pickle.load(file_handle)
+G = 6.67408e-11
+AU = 1.496e11
+DURATION = 1293840000
 
-def projectile_slope_func(projectile, t, system):
-	"""
-	System, must contain an other_bodies property, which is
-	an array of dictionaries containing information about each 
-	body, with the following structure:
-
-	Body: {
-		mass: num
-		radius: num
-		position_interpolations: dict
-			x: function
-			y: function
-		positions: TimeFrame
-			x: TimeSeries
-			y: TimeSeries
+sun_mass = 1.989e30
+sun_radius = 695700e3
+
+# name, orbital radius in AU, mass, radius
+planet_specs = [
+	('mercury', 0.39, 3.285e23, 2440e3),
+	('venus', 0.72, 4.867e24, 6052e3),
+	('earth', 1.0, 5.972e24, 6371e3),
+	('mars', 1.52, 6.39e23, 3390e3),
+	('jupiter', 5.2, 1.898e27, 69911e3),
+	('saturn', 9.5, 5.683e26, 58232e3),
+	('uranus', 19.2, 8.681e25, 25362e3),
+	('neptune', 30.1, 1.024e26, 24622e3),
+]
+
+
+def synthetic_body(name, mass, radius, ts, x, y, vx, vy):
+	positions = TimeFrame({"x": x, "y": y, "vx": vx, "vy": vy}, index=ts)
+	return {
+		"name": name,
+		"mass": mass,
+		"radius": radius,
+		"position_interpolations": sample_interpolations(ts, positions.x.values, positions.y.values),
+		"positions": positions,
 	}
+
+
+def synthetic_bodies(ts):
+	"""The sun and the planets on circular orbits, sampled at `ts`.
+
+	returns: list of body dictionaries, sun last
+	"""
+	ts = np.asarray(ts, dtype=np.float64)
+	bodies = []
+	for phase, (name, distance, mass, radius) in enumerate(planet_specs):
+		r = distance * AU
+		w = np.sqrt(G * sun_mass / r**3)
+		theta = w * ts + phase
+		bodies.append(synthetic_body(name, mass, radius, ts, r * np.cos(theta), r * np.sin(theta),
+									 -r * w * np.sin(theta), r * w * np.cos(theta)))
+
+	zeros = np.zeros_like(ts)
+	bodies.append(synthetic_body('sun', sun_mass, sun_radius, ts, zeros, zeros, zeros, zeros))
+	return bodies
+
+
+def make_system(num=1000):
+	"""System with the synthetic bodies and `num` output times."""
+	system = System(init=None, G=G, ts=linspace(0, DURATION, num))
+	system.other_bodies = synthetic_bodies(system.ts)
+	return system
+
+
+def launch_state(system, angle=0.0, speed=1.4):
+	"""Leaving the earth along its orbit, turned by `angle` radians and
+	at `speed` times the earth's orbital speed.
 	"""
+	earth = system.other_bodies[2]['positions'].iloc[0]
+	c, s = np.cos(angle), np.sin(angle)
+	return State(x=earth.x * 1.0001, y=earth.y * 1.0001,
+				 vx=speed * (c * earth.vx - s * earth.vy),
+				 vy=speed * (s * earth.vx + c * earth.vy))
+
+
+# Each benchmark sets up its data and returns a function to time, the
+# number of items that function processes, and what the items are
+
+def ephemeris_lookup():
+	table = body_table(make_system())
+	times = np.random.RandomState(0).uniform(0, DURATION, 1000)
+
+	def run():
+		for t in times:
+			table.positions(t)
+
+	return run, len(times), 'lookups'
+
+
+def slope():
+	system = make_system()
+	init = launch_state(system)
+	state = np.array(init.values, dtype=np.float64)
+	times = np.random.RandomState(0).uniform(0, DURATION, 1000)
+	body_table(system)
+
+	def run():
+		for t in times:
+			projectile_slope_func(state, t, system)
+
+	return run, len(times), 'evaluations'
+
+
+def trajectory():
+	system = make_system()
+	init = launch_state(system)
+
+	def run():
+		system.init = init
+		run_trajectory(system)
+
+	return run, len(system.ts), 'samples'
+
 
-	x, y, vx, vy = projectile
-	other_bodies = system.other_bodies
-	G = system.G
-	
-	pos = Vector(x, y)
-	acc_net = Vector(0.0,0.0)
-
-	for body in other_bodies:
-		
-		x_body = body["position_interpolations"]['x'](t)
-		y_body = body["position_interpolations"]['y'](t)
-
-		pos_body = Vector(x_body, y_body)
-		distance = pos.dist(pos_body).m
-
-		if distance > body["radius"]:
-			acc_net += - (G * body["mass"] / (distance**2)) * (pos-pos_body).hat()
-		else:
-			# hit body surface
-			return  0, 0, 0, 0
-
-	return vx, vy, acc_net.x.m, acc_net.y.m
-
-system = System(
-	init=None,
-	G=np.float64(6.67408e-11), 
-	ts=linspace(0,1293840000,1000)
-)
-
-sun_frame = TimeFrame({"x": 0, "y": 0, "vx": 0, "vy": 0},[0,1])
-sun = {
-	"mass": 1.989e30,
-	"radius": 695700e3,
-	"name": 'sun',
-	"position_interpolations": {
-		"x": interpolate(sun_frame.x),
-		"y": interpolate(sun_frame.y)
-	},
-	"positions": sun_frame,
+def sweep_100():
+	system = make_system()
+	inits = [launch_state(system, angle) for angle in linspace(-0.5, 0.3, 100)]
+
+	def run():
+		run_ensemble(system, inits)
+
+	return run, len(inits), 'trajectories'
+
+
+def artifacts():
+	bodies = synthetic_bodies(linspace(0, DURATION, 10000))
+	nbytes = sum(body['positions'].values.nbytes for body in bodies)
+
+	def run():
+		with tempfile.TemporaryDirectory() as directory:
+			filepath = os.path.join(directory, 'bodies.artifact')
+			save_bodies(filepath, bodies)
+			for body in load_bodies(filepath):
+				body['position_interpolations']['x'](DURATION / 2)
+				body['positions'].x.values.sum()
+
+	return run, nbytes, 'bytes'
+
+
+def render(mode):
+	def benchmark():
+		system = make_system()
+		frames = linspace(0, DURATION, 20)
+		bodies = system.other_bodies
+		table = frame_positions(bodies, frames)
+		fig, renderer = make_animation(table, mode, ['C0'] * len(bodies), 5e12, title='benchmark',
+									   radii=[np.power(body['radius'], 1/4) * 8e8 for body in bodies])
+
+		def run():
+			renderer.init()
+			for frame in range(len(frames)):
+				renderer(frame)
+				fig.canvas.draw()
+
+		return run, len(frames), 'frames'
+
+	return benchmark
+
+
+benchmarks = {
+	"ephemeris_lookup": ephemeris_lookup,
+	"slope": slope,
+	"trajectory": trajectory,
+	"sweep_100": sweep_100,
+	"artifacts": artifacts,
+	"render_update": render('update'),
+	"render_trail": render('trail'),
 }
 
-earth = get_body('earth', Time('1977-08-20')).icrs.cartesian
 
-voyager_init = State(
-			x = earth.x.to_value('m'), 
-			y = earth.y.to_value('m') + 6371e3,
-			vx = 0, 
-			vy = 38.5e3)
+def measure(benchmark, repeat=3):
+	"""Runs one benchmark.
+
+	benchmark: function that returns a function to time, the number of
+		items it processes and their unit
+	repeat: number of timed runs
+
+	returns: dictionary with the best `seconds`, `throughput` (items per
+		second), `unit` and `peak_bytes`
+	"""
+	run, items, unit = benchmark()
+
+	# the traced run also warms up caches (body tables, interpolators)
+	tracemalloc.start()
+	run()
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	best = np.inf
+	for _ in range(repeat):
+		start = time.perf_counter()
+		run()
+		best = min(best, time.perf_counter() - start)
+
+	return {"seconds": best, "throughput": items / best, "unit": unit, "peak_bytes": peak}
+
+
+def compare(results, baseline, threshold):
+	"""Benchmarks that got slower than their baseline by more than
+	`threshold` (a fraction).
+
+	returns: list of (name, fraction slower)
+	"""
+	regressions = []
+	for name, result in results.items():
+		if name in baseline:
+			slower = result["seconds"] / baseline[name]["seconds"] - 1
+			if slower > threshold:
+				regressions.append((name, slower))
+	return regressions
+
+
+def argument(name, default=None):
+	"""Value of a `name=value` command line argument."""
+	for arg in sys.argv:
+		if arg.startswith(f'{name}='):
+			return arg[len(name) + 1:]
+	return default
+
+
+if __name__ == '__main__':
+	baseline_path = argument('baseline', 'build/benchmark_baseline.json')
+	threshold = float(argument('threshold', 0.25))
+	repeat = int(argument('repeat', 3))
+	names = argument('only', ','.join(benchmarks)).split(',')
+
+	baseline = {}
+	if os.path.exists(baseline_path):
+		with open(baseline_path) as file_handle:
+			baseline = json.load(file_handle)["results"]
+
+	results = {}
+	for name in names:
+		results[name] = result = measure(benchmarks[name], repeat)
+		change = ''
+		if name in baseline:
+			change = f'{(result["seconds"] / baseline[name]["seconds"] - 1) * 100:+.1f}% vs baseline'
+		print(f'{name:18} {result["seconds"] * 1000:10.2f} ms {result["throughput"]:14.1f} {result["unit"]}/s '
+			  f'{result["peak_bytes"] / 2**20:8.1f} MiB peak  {change}')
 
-system.init = voyager_init
-system.other_bodies = planets + [sun]
-'''
+	if 'save' in sys.argv:
+		with open(baseline_path, 'w') as file_handle:
+			json.dump({
+				"machine": platform.node(),
+				"python": platform.python_version(),
+				"numpy": np.__version__,
+				"saved": time.strftime('%Y-%m-%d %H:%M:%S'),
+				"results": {**baseline, **results},
+			}, file_handle, indent=2)
+		print(f'Saved baseline to {baseline_path}')
+		sys.exit(0)
 
-num = 1000
-print(timeit("projectile_slope_func(voyager_init, system.ts[0], system)", setup=setup, number=num)/num)
\ No newline at end of file
+	regressions = compare(results, baseline, threshold)
+	for name, slower in regressions:
+		print(f'Regression: {name} is {slower * 100:.1f}% slower than its baseline (threshold {threshold * 100:.0f}%)')
+	sys.exit(1 if regressions else 0)
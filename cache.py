@@ -0,0 +1,273 @@
+"""
+Content-addressed cache of simulation results.
+
+Each run is keyed on a hash of everything that determines its result: the
+System's parameters (including `init` and `ts`), the bodies in
+`other_bodies`, the slope function, the event functions and the solver
+options, along with the source of the modules that run them (so editing
+the gravity, the solver defaults or anything the slope function calls
+invalidates the cache) and the version of the key format. Results are
+kept as .npz files in a directory, and the least recently used ones are
+deleted when the directory grows past a size limit.
+"""
+
+import functools
+import hashlib
+import importlib.util
+import os
+import sys
+import numpy as np
+from modsim import DataFrame, TimeFrame, run_odeint
+
+# attributes (rather than items) of a System that affect its results
+SYSTEM_ATTRIBUTES = ('other_bodies',)
+
+# body keys derived from other keys, left out of the hash
+DERIVED_KEYS = ('position_interpolations',)
+
+# bump this whenever the key or the stored results change meaning
+KEY_VERSION = 2
+
+# modules every run goes through, whose source is part of every key; the
+# modules that define the slope function and the events are added to these
+SOURCE_MODULES = ('modsim', 'gravity', 'ephemeris')
+
+
+class RunHasher:
+	"""
+	Computes the keys of runs (see key), without a cache to keep their
+	results in. The digests of bodies and module sources are remembered
+	between keys.
+	"""
+
+	def __init__(self):
+		# digests of bodies, which are the same for every run in a sweep;
+		# the body is kept with its digest so its id can't be reused
+		self._memo = {}
+
+		# digests of module sources, read once per cache
+		self._sources = {}
+
+	def _source(self, module_name):
+		"""Digest of the source file of a module, or b'' if it has none."""
+		if module_name not in self._sources:
+			module = sys.modules.get(module_name)
+			if module is not None:
+				path = getattr(module, '__file__', None)
+			else:
+				spec = importlib.util.find_spec(module_name)
+				path = spec.origin if spec is not None else None
+			digest = b''
+			if path is not None and path.endswith('.py'):
+				with open(path, 'rb') as file_handle:
+					digest = hashlib.sha256(file_handle.read()).digest()
+			self._sources[module_name] = digest
+		return self._sources[module_name]
+
+	def _update(self, hasher, value):
+		"""Feeds a canonical encoding of `value` to `hasher`."""
+		update = hasher.update
+
+		if value is None or isinstance(value, (bool, int, float, str, np.generic)):
+			update(f'{type(value).__name__}:{value!r};'.encode())
+
+		elif isinstance(value, np.ndarray):
+			update(f'array:{value.dtype.str}:{value.shape};'.encode())
+			update(np.ascontiguousarray(value).tobytes())
+
+		elif isinstance(value, (DataFrame, TimeFrame)):
+			update(b'frame;')
+			self._update(hasher, list(value.columns))
+			self._update(hasher, np.asarray(value.index, dtype=np.float64))
+			self._update(hasher, value.values)
+
+		elif hasattr(value, 'index') and hasattr(value, 'values'):
+			# Series, System and State
+			update(b'series;')
+			self._update(hasher, [str(key) for key in value.index])
+			for item in value.values:
+				self._update(hasher, item)
+
+		elif isinstance(value, dict):
+			memo = self._memo.get(id(value))
+			if memo is not None and memo[0] is value:
+				update(memo[1])
+				return
+			digest = hashlib.sha256()
+			digest.update(b'dict;')
+			for key in sorted(value, key=str):
+				if key in DERIVED_KEYS:
+					continue
+				self._update(digest, str(key))
+				self._update(digest, value[key])
+			self._memo[id(value)] = (value, digest.digest())
+			update(digest.digest())
+
+		elif isinstance(value, (list, tuple)):
+			update(f'seq:{len(value)};'.encode())
+			for item in value:
+				self._update(hasher, item)
+
+		elif isinstance(value, functools.partial):
+			update(b'partial;')
+			self._update(hasher, [value.func, list(value.args), value.keywords])
+
+		elif callable(value) and hasattr(value, '__code__'):
+			# functions, including closures made by periapsis_event and friends
+			code = value.__code__
+			update(f'function:{value.__module__}.{value.__qualname__}.{value.__name__};'.encode())
+			update(code.co_code)
+			self._update(hasher, [const for const in code.co_consts if not hasattr(const, 'co_code')])
+			self._update(hasher, [cell.cell_contents for cell in (value.__closure__ or ())])
+			self._update(hasher, {name: getattr(value, name) for name in ('terminal', 'direction') if hasattr(value, name)})
+
+		elif hasattr(value, '__dict__'):
+			# other objects, by their public attributes
+			update(f'object:{type(value).__module__}.{type(value).__qualname__};'.encode())
+			self._update(hasher, {key: val for key, val in vars(value).items() if not key.startswith('_')})
+
+		else:
+			raise TypeError(f"RunHasher doesn't know how to hash {type(value)}")
+
+	def key(self, system, slope_func, events=None, extra=None, exclude=(), **options):
+		"""Computes the key of a run.
+
+		Same arguments as run_odeint, plus
+		extra: anything else the results depend on (such as the
+			threshold of system.body_selector)
+		exclude: names of System items (or attributes such as
+			other_bodies) to leave out
+
+		returns: hex digest string
+		"""
+		hasher = hashlib.sha256()
+		self._update(hasher, KEY_VERSION)
+
+		modules = list(SOURCE_MODULES)
+		for func in [slope_func] + list(events or []):
+			module = getattr(func, '__module__', None) or type(func).__module__
+			if module not in modules:
+				modules.append(module)
+		for module in modules:
+			hasher.update(f'module:{module};'.encode())
+			hasher.update(self._source(module))
+
+		items = [name for name in exclude if name in system.index]
+		self._update(hasher, system.drop(items) if items else system)
+		self._update(hasher, {name: getattr(system, name) for name in SYSTEM_ATTRIBUTES
+							  if hasattr(system, name) and name not in exclude})
+		self._update(hasher, slope_func)
+		self._update(hasher, list(events or []))
+		self._update(hasher, options)
+		self._update(hasher, extra)
+		return hasher.hexdigest()
+
+
+class ResultCache(RunHasher):
+	"""
+	On-disk cache of run_odeint results with LRU eviction.
+
+	ResultCache: {
+		directory: str
+		max_bytes: num, size limit of the directory
+		hits: num
+		misses: num
+	}
+	"""
+
+	def __init__(self, directory='build/cache', max_bytes=2**30):
+		super().__init__()
+		self.directory = directory
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		os.makedirs(directory, exist_ok=True)
+
+	def _path(self, key):
+		return os.path.join(self.directory, key + '.npz')
+
+	def load(self, key, system):
+		"""Puts the cached results for `key` in `system`.
+
+		returns: True if there were any
+		"""
+		path = self._path(key)
+		try:
+			with np.load(path) as data:
+				system.results = TimeFrame(data['results'], columns=list(data['columns']), index=data['index'])
+				if 'event_names' in data:
+					events = DataFrame(data['event_values'], columns=['t'] + list(data['columns']))
+					events.insert(0, 'event', data['event_names'].tolist())
+					system.events = events
+		except (FileNotFoundError, OSError, KeyError, ValueError):
+			return False
+
+		# mark it as recently used
+		os.utime(path)
+		return True
+
+	def store(self, key, system, events=False):
+		"""Saves the results (and events) in `system` under `key`."""
+		results = system.results
+		arrays = {
+			"results": results.values,
+			"columns": np.array([str(column) for column in results.columns]),
+			"index": np.asarray(results.index, dtype=np.float64),
+		}
+		if events:
+			arrays["event_names"] = np.array([str(name) for name in system.events.event], dtype=str)
+			arrays["event_values"] = system.events.drop(columns='event').values.astype(np.float64)
+
+		# write to a temporary file first so readers never see half a file
+		path = self._path(key)
+		temporary = f'{path}.{os.getpid()}.tmp.npz'
+		np.savez(temporary, **arrays)
+		os.replace(temporary, path)
+
+		self.evict()
+
+	def evict(self):
+		"""Deletes the least recently used results until the directory
+		is within max_bytes.
+		"""
+		entries = []
+		total = 0
+		for entry in os.scandir(self.directory):
+			if entry.name.endswith('.npz') and not entry.name.endswith('.tmp.npz'):
+				stat = entry.stat()
+				entries.append((stat.st_mtime, stat.st_size, entry.path))
+				total += stat.st_size
+
+		entries.sort()
+		for _, size, path in entries:
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+			total -= size
+
+	def run(self, system, slope_func, events=None, extra=None, **options):
+		"""Same as run_odeint, but reuses the results of an identical
+		earlier run if there is one in the cache.
+
+		Only system.results and system.events are restored on a hit; any
+		other state the slope function leaves in the System (such as the
+		counts of a BodySelector) is not. `stats` doesn't change the
+		results, so it isn't part of the key; on a hit, system.stats is
+		None, since no solver ran.
+
+		extra: see ResultCache.key
+		"""
+		stats = options.pop('stats', False)
+		key = self.key(system, slope_func, events, extra, **options)
+		if self.load(key, system):
+			self.hits += 1
+			if stats:
+				system.stats = None
+			return
+
+		self.misses += 1
+		run_odeint(system, slope_func, events=events, stats=stats, **options)
+		self.store(key, system, events=bool(events))
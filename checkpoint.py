@@ -0,0 +1,225 @@
+"""
+Segmented integration with checkpoints on disk.
+
+A long run is integrated one window of `ts` at a time. After each window,
+its rows are appended to a results file and a small manifest records how
+far the run got and the state to carry on from, so an interrupted run
+resumes from its last window, and a run over a longer `ts` (with the same
+samples at the start) only integrates what comes after the saved ones.
+
+A checkpoint directory holds:
+
+	manifest.json  key of the problem, columns, rows saved, the last
+	               step size, whether an event stopped the run and
+	               where the bodies were at some of the saved samples
+	results.f64    raw float64 rows of t and the state, one per sample
+"""
+
+import json
+import os
+import numpy as np
+from modsim import DataFrame, State, TimeFrame, run_odeint, underride
+from cache import RunHasher
+
+MANIFEST = 'manifest.json'
+RESULTS = 'results.f64'
+
+# body keys that hold (or are built from) its trajectory
+TRAJECTORY_KEYS = ('positions', 'position_interpolations', 'ephemeris')
+
+# at most this many saved samples are used to check that the bodies are
+# where they were (see body_fingerprint)
+FINGERPRINT_SAMPLES = 256
+
+# how far (in meters) a body may be from where it was at those samples;
+# bodies regenerated over a longer `ts` match to well within this
+BODY_TOLERANCE = 1e3
+
+
+def problem_key(system, slope_func, events=None, extra=None, **options):
+	"""Hash of everything that determines a run except how far `ts`
+	goes and the trajectories of the bodies (see RunHasher.key), so
+	the run can be extended with the same bodies over a longer time.
+	The bodies' other fields (name, mass, radius, ...) are part of the
+	key; their trajectories are checked by body_fingerprint instead.
+	"""
+	hasher = RunHasher()
+	start = float(np.asarray(system.ts, dtype=np.float64)[0])
+	bodies = [{key: body[key] for key in body.keys() if key not in TRAJECTORY_KEYS}
+			  for body in getattr(system, 'other_bodies', [])]
+	return hasher.key(system, slope_func, events, (extra, start, bodies), exclude=('ts', 'other_bodies'), **options)
+
+
+def body_fingerprint(system, ts):
+	"""Positions of system.other_bodies at up to FINGERPRINT_SAMPLES of
+	the times in `ts`, always including the last one.
+
+	returns: list (bodies) of lists (samples) of [x, y]
+	"""
+	# gravity imports this module, so body_states is imported here
+	from gravity import body_states
+
+	if len(ts) == 0:
+		return []
+	picks = np.unique(np.linspace(0, len(ts) - 1, min(len(ts), FINGERPRINT_SAMPLES)).round().astype(int))
+	times = np.asarray(ts, dtype=np.float64)[picks]
+	return [body_states(body)(times)[:, :2].tolist() for body in getattr(system, 'other_bodies', [])]
+
+
+def read_manifest(directory):
+	"""The manifest of a checkpoint directory, or None if there is none."""
+	try:
+		with open(os.path.join(directory, MANIFEST)) as file_handle:
+			return json.load(file_handle)
+	except FileNotFoundError:
+		return None
+
+
+def _write_manifest(directory, manifest):
+	# write to a temporary file first so an interrupt never leaves half a
+	# manifest behind
+	path = os.path.join(directory, MANIFEST)
+	temporary = f'{path}.tmp'
+	with open(temporary, 'w') as file_handle:
+		json.dump(manifest, file_handle)
+	os.replace(temporary, path)
+
+
+def load_checkpoint(directory, manifest=None):
+	"""The results saved in a checkpoint directory, memory-mapped.
+
+	returns: TimeFrame (one row per saved sample), DataFrame of events
+	"""
+	manifest = manifest or read_manifest(directory)
+	columns = manifest["columns"]
+	rows = manifest["rows"]
+
+	if rows:
+		array = np.memmap(os.path.join(directory, RESULTS), dtype=np.float64, mode='r', shape=(rows, len(columns) + 1))
+	else:
+		array = np.empty((0, len(columns) + 1))
+	results = TimeFrame(array[:, 1:], columns=columns, index=array[:, 0], copy=False)
+	events = DataFrame(manifest["events"], columns=['event', 't'] + columns)
+	return results, events
+
+
+def run_segmented(system, slope_func, directory, window=1000, events=None, extra=None, **options):
+	"""Same as run_odeint, but integrates `window` samples of `system.ts`
+	at a time and checkpoints each window to `directory`.
+
+	If `directory` already holds a checkpoint of the same problem (see
+	problem_key), the run continues from where it left off. Its samples
+	must be the first ones of `system.ts`, and the bodies must be where
+	they were at those samples (to within BODY_TOLERANCE); if `ts` is
+	longer than before, only the new samples are integrated, so the
+	bodies' trajectories have to cover the longer `ts` (regenerate them
+	over it rather than extrapolating past their end).
+
+	The solver restarts at each window from the saved state, with the
+	step size it last used. Only one window of results is in memory at a
+	time: the results in `system` are memory-mapped from the checkpoint,
+	and system.stats (see SolverStats) is that of the last window.
+
+	system: System with `init` and `ts` (plain numbers, without units)
+	slope_func: function that computes slopes
+	directory: where to keep the checkpoint, one per problem
+	window: number of samples per window, at least 2
+	events: sequence of event functions (see run_events); a terminal
+		event stops the run for good
+	extra: anything else the results depend on (see ResultCache.key)
+	options: passed along to run_odeint
+
+	returns: number of samples integrated by this call
+	"""
+	if options.get('samples'):
+		raise ValueError("Checkpointed runs keep the samples in system.ts, so they can't use `samples`.")
+
+	os.makedirs(directory, exist_ok=True)
+	key = problem_key(system, slope_func, events, extra, **options)
+	ts = np.asarray(system.ts, dtype=np.float64)
+	columns = [str(name) for name in system.init.index]
+
+	manifest = read_manifest(directory)
+	if manifest is not None and manifest["key"] != key:
+		msg = f"""{directory} holds a checkpoint of a different problem
+				 (different init, parameters, bodies, slope function,
+				 events or options). Use another directory, or delete it
+				 to start over."""
+		raise ValueError(msg)
+	if manifest is None:
+		manifest = {"key": key, "columns": columns, "rows": 0, "step": None, "stopped": False, "events": [],
+					"bodies": []}
+
+	rows = manifest["rows"]
+	results_path = os.path.join(directory, RESULTS)
+	saved, _ = load_checkpoint(directory, manifest)
+	if not np.array_equal(np.asarray(saved.index), ts[:rows]):
+		msg = f"""The samples saved in {directory} are not the first
+				 {rows} samples of system.ts."""
+		raise ValueError(msg)
+
+	saved_bodies = np.asarray(manifest["bodies"], dtype=np.float64)
+	current_bodies = np.asarray(body_fingerprint(system, ts[:rows]), dtype=np.float64)
+	if saved_bodies.shape != current_bodies.shape or not np.allclose(saved_bodies, current_bodies, rtol=0, atol=BODY_TOLERANCE):
+		msg = f"""The bodies in system.other_bodies are not where they
+				 were during the {rows} samples saved in {directory}.
+				 Use another directory, or delete it to start over."""
+		raise ValueError(msg)
+
+	# rows written after the last manifest, by a run that was interrupted
+	# before it could record them, are dropped
+	with open(results_path, 'ab') as file_handle:
+		file_handle.truncate(rows * (len(columns) + 1) * 8)
+
+	init, full_ts = system.init, system.ts
+	integrated = 0
+	try:
+		while rows < len(ts) and not manifest["stopped"]:
+			# each window after the first starts at the last saved sample
+			start = max(rows - 1, 0)
+			stop = min(start + window, len(ts))
+			if rows:
+				system.init = State(**dict(zip(columns, _last_row(results_path, rows, columns))))
+
+			system.ts = ts[start:stop]
+			# the stats give the step size to start the next window with
+			window_options = dict(options, stats=True)
+			if manifest["step"]:
+				step = min(manifest["step"], ts[stop - 1] - ts[start])
+				underride(window_options, **({"first_step": step} if events else {"h0": step}))
+			run_odeint(system, slope_func, events=events, **window_options)
+
+			results = system.results
+			new = np.column_stack([np.asarray(results.index, dtype=np.float64), results.values])
+			new = new[1:] if rows else new
+
+			with open(results_path, 'ab') as file_handle:
+				file_handle.write(np.ascontiguousarray(new, dtype=np.float64).tobytes())
+				file_handle.flush()
+				os.fsync(file_handle.fileno())
+
+			if events:
+				window_events = system.events
+				manifest["events"] += [[row[0]] + [float(value) for value in row[1:]]
+									   for row in window_events.itertuples(index=False)]
+
+			rows += len(new)
+			integrated += len(new)
+			manifest["rows"] = rows
+			manifest["step"] = float(abs(system.stats.step_sizes[-1])) if len(system.stats.step_sizes) else None
+			manifest["stopped"] = len(results) < len(system.ts)
+			manifest["bodies"] = body_fingerprint(system, ts[:rows])
+			_write_manifest(directory, manifest)
+	finally:
+		system.init, system.ts = init, full_ts
+
+	system.results, system.events = load_checkpoint(directory, manifest)
+	return integrated
+
+
+def _last_row(results_path, rows, columns):
+	"""The state in the last saved row."""
+	with open(results_path, 'rb') as file_handle:
+		file_handle.seek((rows - 1) * (len(columns) + 1) * 8)
+		row = np.frombuffer(file_handle.read((len(columns) + 1) * 8), dtype=np.float64)
+	return row[1:]
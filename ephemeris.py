@@ -0,0 +1,605 @@
+"""
+Ephemeris tables for looking up body positions during a simulation.
+
+Planet trajectories are sampled on `system.ts`, which comes from `linspace`
+and is uniform, so the segment containing a time can be found with index
+arithmetic instead of the binary search interp1d does on every call.
+
+ChebyshevEphemeris stores a trajectory as piecewise Chebyshev series
+instead of samples, which is far smaller and also gives velocities.
+
+KeplerOrbits needs no trajectory at all: it evaluates two-body orbits in
+closed form from their elements at an epoch.
+"""
+
+import functools
+import math
+import warnings
+import numpy as np
+from numpy.polynomial import chebyshev
+from scipy.interpolate import interp1d
+
+
+def is_uniform(index, rtol=1e-9):
+	"""Checks whether a time index is evenly spaced.
+
+	index: sequence of at least two increasing times
+	rtol: relative tolerance on the spacing
+
+	returns: boolean
+	"""
+	index = np.asarray(index, dtype=np.float64)
+	if len(index) < 2:
+		return False
+	dt = (index[-1] - index[0]) / (len(index) - 1)
+	return dt > 0 and np.allclose(np.diff(index), dt, rtol=rtol, atol=0)
+
+
+class EphemerisTable:
+	"""
+	Linear interpolation of several columns over a uniform time grid.
+
+	EphemerisTable: {
+		t0: num, first time on the grid
+		dt: num, grid spacing
+		values: array (n, k), one row per grid time
+	}
+
+	Times outside the grid are extrapolated from the first or last segment,
+	the same as `interpolate` with fill_value='extrapolate'.
+	"""
+
+	def __init__(self, t0, dt, values):
+		values = np.asarray(values, dtype=np.float64)
+		if values.ndim == 1:
+			values = values[:, None]
+		if len(values) < 2:
+			raise ValueError('An EphemerisTable needs at least two rows')
+
+		self.t0 = float(t0)
+		self.dt = float(dt)
+		self.values = values
+		self.steps = np.diff(values, axis=0)
+		self._last = len(values) - 2
+
+	@classmethod
+	def from_frame(cls, frame, columns=('x', 'y')):
+		"""Builds a table from the columns of a TimeFrame.
+
+		frame: TimeFrame with a uniform time index
+		columns: names of the columns to interpolate, in output order
+
+		returns: EphemerisTable
+		"""
+		index = np.asarray(frame.index, dtype=np.float64)
+		if not is_uniform(index):
+			msg = """The TimeFrame you passed to EphemerisTable.from_frame
+					 does not have an evenly-spaced index."""
+			raise ValueError(msg)
+
+		dt = (index[-1] - index[0]) / (len(index) - 1)
+		values = np.column_stack([frame[column].values for column in columns])
+		return cls(index[0], dt, values)
+
+	def __len__(self):
+		return len(self.values)
+
+	def __call__(self, t):
+		"""Interpolates every column at `t`.
+
+		t: scalar or array of times
+
+		returns: array (k,) for scalar `t`, otherwise t.shape + (k,)
+		"""
+		if np.ndim(t) == 0:
+			s = (t - self.t0) / self.dt
+			i = min(max(math.floor(s), 0), self._last)
+			return self.values[i] + self.steps[i] * (s - i)
+
+		s = (np.asarray(t, dtype=np.float64) - self.t0) / self.dt
+		i = np.clip(np.floor(s).astype(np.intp), 0, self._last)
+		return self.values[i] + self.steps[i] * (s - i)[..., None]
+
+
+def stacked_ephemeris(index, values):
+	"""Interpolation function over the columns of `values`.
+
+	Uses an EphemerisTable when `index` is uniform and falls back to a
+	stacked interp1d otherwise.
+
+	index: array (n,) of times
+	values: array (n, k)
+
+	returns: function that maps a scalar time to an array (k,)
+	"""
+	index = np.asarray(index, dtype=np.float64)
+	if is_uniform(index):
+		dt = (index[-1] - index[0]) / (len(index) - 1)
+		return EphemerisTable(index[0], dt, values)
+	return interp1d(index, values, axis=0, fill_value='extrapolate', assume_sorted=True)
+
+
+class HermiteEphemeris:
+	"""
+	Cubic Hermite interpolation of positions, from samples of the
+	positions and velocities at any increasing times, such as those
+	picked by modsim.adaptive_times.
+
+	HermiteEphemeris: {
+		index: array (n,) of sample times
+		values: array (n, 2) of x, y
+		derivatives: array (n, 2) of vx, vy
+		hold: whether times outside the samples hold the first or last
+			position, instead of following the first or last cubic
+	}
+
+	Sparse samples along a curved path stay on it between samples, where
+	straight lines between them would cut corners.
+	"""
+
+	def __init__(self, index, values, derivatives, hold=False):
+		self.index = np.asarray(index, dtype=np.float64)
+		self.values = np.asarray(values, dtype=np.float64)
+		self.derivatives = np.asarray(derivatives, dtype=np.float64)
+		self.hold = hold
+		self._last = len(self.index) - 2
+
+	def __call__(self, t):
+		"""Positions at `t`.
+
+		returns: array (2,) of x, y for scalar `t`, otherwise t.shape + (2,)
+		"""
+		t = np.asarray(t, dtype=np.float64)
+		if self.hold:
+			t = np.clip(t, self.index[0], self.index[-1])
+		i = np.clip(np.searchsorted(self.index, t, side='right') - 1, 0, self._last)
+
+		t0, t1 = self.index[i], self.index[i + 1]
+		h = (t1 - t0)[..., None]
+		s = ((t - t0) / (t1 - t0))[..., None]
+		s2, s3 = s * s, s * s * s
+		return ((2*s3 - 3*s2 + 1) * self.values[i] + (s3 - 2*s2 + s) * h * self.derivatives[i] +
+				(-2*s3 + 3*s2) * self.values[i + 1] + (s3 - s2) * h * self.derivatives[i + 1])
+
+	def interpolations(self):
+		"""Separate x and y functions, like a body's position_interpolations.
+
+		returns: dictionary of functions of time
+		"""
+		return {
+			"x": functools.partial(_column, self, 0),
+			"y": functools.partial(_column, self, 1),
+		}
+
+
+class ChebyshevEphemeris:
+	"""
+	Piecewise Chebyshev fit of a trajectory, in the spirit of a JPL SPK
+	file: the time range is split into equal segments, each with its own
+	Chebyshev series for x and y, and velocities come from the series'
+	derivatives.
+
+	ChebyshevEphemeris: {
+		t0: num, start of the first segment
+		span: num, length of each segment
+		degree: num
+		coefficients: array (segments, degree + 1, 2)
+		max_error: num, estimated largest position error, at the fitted
+			samples and between them (see fit)
+		max_speed: num, largest fitted speed at the samples
+	}
+
+	Times outside the fitted range are extrapolated from the first or
+	last segment's series.
+	"""
+
+	def __init__(self, t0, span, coefficients, max_error, max_speed, index):
+		self.t0 = float(t0)
+		self.span = float(span)
+		self.coefficients = np.asarray(coefficients, dtype=np.float64)
+		self.degree = self.coefficients.shape[1] - 1
+		self.max_error = max_error
+		self.max_speed = max_speed
+		self._index = index
+		self._last = len(self.coefficients) - 1
+		self._derivatives = None
+
+	@classmethod
+	def fit(cls, frame, degree=12, tol=1e3):
+		"""Fits the x and y columns of a TimeFrame.
+
+		Segments are halved until the fit is within `tol` of every
+		sample and between samples, or until a segment would have too
+		few samples to pin down its series. The error between samples is
+		measured by fitting every other sample the same way and checking
+		that fit at the samples left out, which are halfway between the
+		ones it was fitted to; near the samples alone, a fit can look
+		far better than it is. If the segments got as short as they can
+		while the error is still above `tol`, a RuntimeWarning says so,
+		and `max_error` is the error actually reached. It is a measured
+		estimate (on smooth orbits, within tens of percent of the true
+		error between samples), not a strict bound.
+
+		frame: TimeFrame with x and y columns
+		degree: degree of the series in each segment
+		tol: target position error, in meters
+
+		returns: ChebyshevEphemeris
+		"""
+		ts = np.asarray(frame.index, dtype=np.float64)
+		values = np.column_stack([frame.x.values, frame.y.values]).astype(np.float64)
+		degree = min(degree, len(ts) - 1)
+
+		# keep the sample times compactly when they came from linspace
+		index = (ts[0], ts[-1], len(ts)) if is_uniform(ts) else ts
+
+		# a fit to every other sample, checked at the ones left out,
+		# measures the error between samples (too few samples can't be
+		# split, and are fitted exactly anyway)
+		between = len(ts[::2]) >= degree + 2
+
+		segments = 1
+		while True:
+			fitted = cls._fit_segments(ts, values, degree, segments)
+			error = np.abs(fitted(ts) - values).max()
+			if between:
+				halves = cls._fit_segments(ts[::2], values[::2], degree, segments)
+				error = max(error, np.abs(halves(ts[1::2]) - values[1::2]).max())
+			if error <= tol:
+				break
+			# the fit to every other sample needs enough of them per segment
+			if len(ts) / (4 * segments) < degree + 2:
+				warnings.warn(f'Chebyshev fit stopped at {segments} segments with a max error of '
+							  f'{error:.1f} m, above the tolerance of {tol:.1f} m; sample the '
+							  'trajectory more densely or lower the degree', RuntimeWarning)
+				break
+			segments *= 2
+
+		speeds = np.hypot(*fitted.velocities(ts).T)
+		fitted.max_error = error
+		fitted.max_speed = speeds.max()
+		fitted._index = index
+		return fitted
+
+	@classmethod
+	def _fit_segments(cls, ts, values, degree, segments):
+		t0 = ts[0]
+		span = (ts[-1] - t0) / segments
+		if span == 0:
+			span = 1.0
+
+		which = np.clip(np.floor((ts - t0) / span).astype(np.intp), 0, segments - 1)
+		coefficients = np.zeros((segments, degree + 1, values.shape[1]))
+		for i in range(segments):
+			mask = which == i
+			u = 2 * (ts[mask] - (t0 + i * span)) / span - 1
+			coefficients[i] = chebyshev.chebfit(u, values[mask], degree)
+
+		return cls(t0, span, coefficients, None, None, None)
+
+	def __getstate__(self):
+		# the derivative series are rebuilt on demand
+		state = self.__dict__.copy()
+		state['_derivatives'] = None
+		return state
+
+	def __len__(self):
+		return len(self.coefficients)
+
+	def _locate(self, t):
+		s = (np.asarray(t, dtype=np.float64) - self.t0) / self.span
+		i = np.clip(np.floor(s).astype(np.intp), 0, self._last)
+		return i, 2 * (s - i) - 1
+
+	def _evaluate(self, coefficients, t):
+		degree = coefficients.shape[1] - 1
+		if np.ndim(t) == 0:
+			s = (t - self.t0) / self.span
+			i = min(max(math.floor(s), 0), self._last)
+			u = 2 * (s - i) - 1
+
+			# Chebyshev polynomials by their recurrence
+			basis = [1.0, u]
+			for _ in range(degree - 1):
+				basis.append(2 * u * basis[-1] - basis[-2])
+			return np.dot(basis[:degree + 1], coefficients[i])
+
+		i, u = self._locate(t)
+		basis = chebyshev.chebvander(u, degree)
+		return np.einsum('...j,...jk->...k', basis, coefficients[i])
+
+	def __call__(self, t):
+		"""Positions at `t`.
+
+		t: scalar or array of times
+
+		returns: array (2,) of x, y for scalar `t`, otherwise t.shape + (2,)
+		"""
+		return self._evaluate(self.coefficients, t)
+
+	def velocities(self, t):
+		"""Velocities at `t`, from the derivatives of the series.
+
+		t: scalar or array of times
+
+		returns: array (2,) of vx, vy for scalar `t`, otherwise t.shape + (2,)
+		"""
+		if self._derivatives is None:
+			self._derivatives = chebyshev.chebder(self.coefficients, axis=1) * (2 / self.span)
+		if self.degree == 0:
+			return np.zeros(np.shape(t) + (2,))
+		return self._evaluate(self._derivatives, t)
+
+	def state(self, t):
+		"""Positions and velocities at `t`.
+
+		returns: array (4,) of x, y, vx, vy for scalar `t`,
+			otherwise t.shape + (4,)
+		"""
+		return np.concatenate([self(t), self.velocities(t)], axis=-1)
+
+	def interpolations(self):
+		"""Separate x and y functions, like a body's position_interpolations.
+
+		returns: dictionary of functions of time
+		"""
+		return {
+			"x": functools.partial(_column, self, 0),
+			"y": functools.partial(_column, self, 1),
+		}
+
+	def sample_times(self):
+		"""The times of the samples the series were fitted to."""
+		if isinstance(self._index, tuple):
+			return np.linspace(*self._index)
+		return self._index
+
+
+def _column(ephemeris, i, t):
+	return ephemeris(t)[..., i]
+
+
+class KeplerOrbits:
+	"""
+	Two-body orbits of several bodies around a fixed central mass, from
+	their osculating elements at an epoch. Positions and velocities at
+	any time are evaluated in closed form, by solving Kepler's equation,
+	for all the bodies and times at once.
+
+	KeplerOrbits: {
+		t0: num, the epoch
+		mu: array (n,), gravitational parameter of the central mass
+		a: array (n,), semi-major axis
+		e: array (n,), eccentricity
+		omega: array (n,), angle of the periapsis from the x axis
+		direction: array (n,), 1 for counterclockwise orbits, -1 for clockwise
+		M0: array (n,), mean anomaly at the epoch
+	}
+
+	Only bound (elliptic) orbits in the x-y plane are supported.
+	"""
+
+	def __init__(self, t0, mu, a, e, omega, direction, M0):
+		self.t0 = float(t0)
+		self.mu = np.asarray(mu, dtype=np.float64)
+		self.a = np.asarray(a, dtype=np.float64)
+		self.e = np.asarray(e, dtype=np.float64)
+		self.omega = np.asarray(omega, dtype=np.float64)
+		self.direction = np.asarray(direction, dtype=np.float64)
+		self.M0 = np.asarray(M0, dtype=np.float64)
+		self._n = np.sqrt(self.mu / self.a**3)
+		self._b = self.a * np.sqrt(1 - self.e**2)
+		self._cos_omega = np.cos(self.omega)
+		self._sin_omega = np.sin(self.omega)
+		self._iterations = self._count_iterations()
+
+		# the same, as plain floats, for looking up a single time
+		self._scalars = list(zip(self.M0.tolist(), self._n.tolist(), self.e.tolist(), self.a.tolist(),
+								 (self.direction * self._b).tolist(), self._cos_omega.tolist(), self._sin_omega.tolist()))
+
+	@classmethod
+	def from_states(cls, states, mu, t0):
+		"""Osculating elements of bodies with the given states at `t0`.
+
+		states: array (n, 4) of x, y, vx, vy relative to the central mass
+		mu: gravitational parameter of the central mass, scalar or array (n,)
+		t0: the epoch
+
+		returns: KeplerOrbits
+		"""
+		states = np.atleast_2d(np.asarray(states, dtype=np.float64))
+		x, y, vx, vy = states.T
+		mu = np.broadcast_to(np.asarray(mu, dtype=np.float64), x.shape)
+
+		r = np.hypot(x, y)
+		v2 = vx**2 + vy**2
+		inverse_a = 2 / r - v2 / mu
+		if np.any(inverse_a <= 0):
+			raise ValueError('KeplerOrbits only supports bound (elliptic) orbits')
+
+		# eccentricity vector, pointing at the periapsis
+		rv = x * vx + y * vy
+		ex = ((v2 - mu / r) * x - rv * vx) / mu
+		ey = ((v2 - mu / r) * y - rv * vy) / mu
+		e = np.hypot(ex, ey)
+		omega = np.arctan2(ey, ex)
+		direction = np.where(x * vy - y * vx >= 0, 1.0, -1.0)
+
+		# true, eccentric and mean anomaly at the epoch
+		nu = direction * (np.arctan2(y, x) - omega)
+		E = np.arctan2(np.sqrt(1 - e**2) * np.sin(nu), e + np.cos(nu))
+		M0 = E - e * np.sin(E)
+
+		return cls(t0, mu, 1 / inverse_a, e, omega, direction, M0)
+
+	def __len__(self):
+		return len(self.a)
+
+	def select(self, indices):
+		"""The orbits of some of the bodies, in the given order.
+
+		returns: KeplerOrbits
+		"""
+		return KeplerOrbits(self.t0, self.mu[indices], self.a[indices], self.e[indices],
+							self.omega[indices], self.direction[indices], self.M0[indices])
+
+	def elements(self, i):
+		"""The elements of body `i`, as a dictionary of numbers that can
+		be passed to KeplerOrbits.from_elements."""
+		return {"t0": self.t0, "mu": float(self.mu[i]), "a": float(self.a[i]), "e": float(self.e[i]),
+				"omega": float(self.omega[i]), "direction": float(self.direction[i]), "M0": float(self.M0[i])}
+
+	@classmethod
+	def from_elements(cls, elements):
+		"""Combines the elements of several bodies (see elements) into one
+		KeplerOrbits. They must all have the same epoch.
+
+		elements: list of dictionaries
+		"""
+		if len({element["t0"] for element in elements}) > 1:
+			raise ValueError('KeplerOrbits need the same epoch for every body')
+		columns = {key: [element[key] for element in elements]
+				   for key in ('mu', 'a', 'e', 'omega', 'direction', 'M0')}
+		return cls(elements[0]["t0"], **columns)
+
+	def _newton(self, M, iterations):
+		e = self.e
+		E = M + e * np.sin(M)
+		for _ in range(iterations):
+			E = E - (E - e * np.sin(E) - M) / (1 - e * np.cos(E))
+		return E
+
+	def _count_iterations(self, tol=1e-12, max_iterations=50):
+		# how many Newton steps converge for every mean anomaly, found
+		# once on a fine grid, so each lookup doesn't have to check
+		M = np.linspace(-np.pi, np.pi, 1025)[:, None]
+		for iterations in range(1, max_iterations + 1):
+			E = self._newton(M, iterations)
+			if np.abs(E - self.e * np.sin(E) - M).max(initial=0) < tol:
+				return iterations + 1
+		return max_iterations
+
+	def eccentric_anomaly(self, t):
+		"""Solves Kepler's equation, E - e sin(E) = M, by Newton's method.
+
+		t: scalar or array of times
+
+		returns: array t.shape + (n,)
+		"""
+		M = self.M0 + self._n * (np.asarray(t, dtype=np.float64)[..., None] - self.t0)
+		return self._newton(M, self._iterations)
+
+	def states(self, t):
+		"""Positions and velocities of every body at `t`.
+
+		t: scalar or array of times
+
+		returns: array t.shape + (n, 4) of x, y, vx, vy
+		"""
+		E = self.eccentric_anomaly(t)
+		cos_E, sin_E = np.cos(E), np.sin(E)
+
+		# in the frame of the orbit, with the periapsis along the x axis
+		xp = self.a * (cos_E - self.e)
+		yp = self.direction * self._b * sin_E
+		rate = self._n / (1 - self.e * cos_E)
+		vxp = -self.a * sin_E * rate
+		vyp = self.direction * self._b * cos_E * rate
+
+		c, s = self._cos_omega, self._sin_omega
+		return np.stack([c * xp - s * yp, s * xp + c * yp,
+						 c * vxp - s * vyp, s * vxp + c * vyp], axis=-1)
+
+	def __call__(self, t):
+		"""Positions of every body at `t`.
+
+		returns: array t.shape + (n, 2) of x, y
+		"""
+		if np.ndim(t) == 0:
+			# a simulation looks up one time per step, and for a handful
+			# of bodies plain floats are faster than array operations
+			dt = t - self.t0
+			positions = []
+			for M0, n, e, a, b, c, s in self._scalars:
+				M = M0 + n * dt
+				E = M + e * math.sin(M)
+				for _ in range(self._iterations):
+					E -= (E - e * math.sin(E) - M) / (1 - e * math.cos(E))
+				xp = a * (math.cos(E) - e)
+				yp = b * math.sin(E)
+				positions.append((c * xp - s * yp, s * xp + c * yp))
+			return np.array(positions)
+
+		E = self.eccentric_anomaly(t)
+		xp = self.a * (np.cos(E) - self.e)
+		yp = self.direction * self._b * np.sin(E)
+
+		c, s = self._cos_omega, self._sin_omega
+		return np.stack([c * xp - s * yp, s * xp + c * yp], axis=-1)
+
+
+class KeplerEphemeris:
+	"""
+	One body of a KeplerOrbits, with the same interface as
+	ChebyshevEphemeris so it can stand in for a body's ephemeris (see
+	gravity.BodyTable, which evaluates bodies sharing a KeplerOrbits
+	together).
+
+	KeplerEphemeris: {
+		orbits: KeplerOrbits the body belongs to
+		index: num, which of its bodies this is
+		max_error: 0, nothing is fitted
+		max_speed: num, speed at the periapsis
+	}
+
+	`sample_times` are only used to sample the orbit where samples are
+	needed (see gravity.body_positions).
+	"""
+	max_error = 0.0
+
+	def __init__(self, orbits, index, sample_times):
+		self.orbits = orbits
+		self.index = index
+		self._index = sample_times
+		self._single = orbits.select([index])
+
+		a, e, mu = orbits.a[index], orbits.e[index], orbits.mu[index]
+		self.max_speed = float(np.sqrt(mu * (1 + e) / (a * (1 - e))))
+
+	def __call__(self, t):
+		"""Positions at `t`.
+
+		returns: array (2,) of x, y for scalar `t`, otherwise t.shape + (2,)
+		"""
+		return self._single(t)[..., 0, :]
+
+	def velocities(self, t):
+		"""Velocities at `t`.
+
+		returns: array (2,) of vx, vy for scalar `t`, otherwise t.shape + (2,)
+		"""
+		return self._single.states(t)[..., 0, 2:]
+
+	def state(self, t):
+		"""Positions and velocities at `t`.
+
+		returns: array (4,) of x, y, vx, vy for scalar `t`,
+			otherwise t.shape + (4,)
+		"""
+		return self._single.states(t)[..., 0, :]
+
+	def interpolations(self):
+		"""Separate x and y functions, like a body's position_interpolations.
+
+		returns: dictionary of functions of time
+		"""
+		return {
+			"x": functools.partial(_column, self, 0),
+			"y": functools.partial(_column, self, 1),
+		}
+
+	def sample_times(self):
+		"""Times to sample the orbit at."""
+		if isinstance(self._index, tuple):
+			return np.linspace(*self._index)
+		return self._index
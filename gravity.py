@@ -0,0 +1,543 @@
+"""
+Array-based gravity for the slingshot simulation.
+
+The bodies a projectile is attracted to are packed into a BodyTable, which
+holds their gravitational parameters, radii and ephemerides in contiguous
+arrays, so the net acceleration on a projectile takes a handful of NumPy
+operations instead of a Python loop over pint Vectors.
+"""
+
+import math
+import numpy as np
+from modsim import TimeFrame, run_odeint
+from ephemeris import ChebyshevEphemeris, KeplerEphemeris, stacked_ephemeris
+from checkpoint import run_segmented
+
+
+class BodyTable:
+	"""
+	Packs a list of body dictionaries into arrays:
+
+	BodyTable: {
+		bodies: list, the body dictionaries the table was built from
+		names: list of str
+		mu: array (n,), G * mass of each body
+		radius: array (n,)
+		max_speed: num, fastest any body moves along its ephemeris
+	}
+
+	Bodies whose `positions` share the same time index are interpolated
+	together, with one stacked ephemeris per group instead of two interp1d
+	calls per body. Uniform indexes (anything from `linspace`) get an
+	EphemerisTable. Compressed bodies (see compress_body) are looked up
+	through their own ChebyshevEphemeris, and bodies with a KeplerEphemeris
+	are evaluated together with the others on the same KeplerOrbits.
+	"""
+
+	def __init__(self, bodies, G):
+		self.bodies = bodies
+		self.G = G
+		self._subtables = {}
+		self.names = [body['name'] for body in bodies]
+		self.mu = G * np.array([body['mass'] for body in bodies], dtype=np.float64)
+		self.radius = np.array([body['radius'] for body in bodies], dtype=np.float64)
+
+		self.max_speed = 0.0
+		self._groups = []
+		groups = []
+		orbits = {}
+
+		for idx, body in enumerate(bodies):
+			if 'positions' not in body:
+				ephemeris = body['ephemeris']
+				self.max_speed = max(self.max_speed, ephemeris.max_speed)
+				if isinstance(ephemeris, KeplerEphemeris):
+					group = orbits.setdefault(id(ephemeris.orbits), {'orbits': ephemeris.orbits, 'members': [], 'indices': []})
+					group['members'].append(idx)
+					group['indices'].append(ephemeris.index)
+				else:
+					self._groups.append((np.array([idx]), ephemeris))
+				continue
+
+			positions = body['positions']
+			if len(positions) > 1:
+				speeds = np.hypot(np.diff(positions.x.values), np.diff(positions.y.values)) / np.diff(positions.index.values)
+				self.max_speed = max(self.max_speed, speeds.max())
+
+			# group bodies by the time index of their positions
+			index = np.asarray(positions.index, dtype=np.float64)
+			for group in groups:
+				if np.array_equal(group['index'], index):
+					group['members'].append(idx)
+					break
+			else:
+				groups.append({'index': index, 'members': [idx]})
+
+		for group in groups:
+			members = group['members']
+			columns = [bodies[idx]['positions'][axis].values for idx in members for axis in ('x', 'y')]
+			values = np.column_stack(columns).astype(np.float64)
+			self._groups.append((np.array(members), stacked_ephemeris(group['index'], values)))
+
+		for group in orbits.values():
+			self._groups.append((np.array(group['members']), group['orbits'].select(group['indices'])))
+
+	def __len__(self):
+		return len(self.names)
+
+	def positions(self, t):
+		"""Positions of every body at time `t`.
+
+		t: scalar time
+
+		returns: array (n, 2) of x, y
+		"""
+		pos = np.empty((len(self), 2))
+		for members, ephemeris in self._groups:
+			pos[members] = ephemeris(t).reshape(-1, 2)
+		return pos
+
+	def subtable(self, indices):
+		"""BodyTable of some of the bodies, in the given order, to look up
+		their positions without the others'. Each one is built once and
+		kept.
+
+		indices: sequence of indices into this table
+
+		returns: BodyTable
+		"""
+		key = tuple(int(idx) for idx in indices)
+		if key == tuple(range(len(self))):
+			return self
+
+		table = self._subtables.get(key)
+		if table is None:
+			table = BodyTable([self.bodies[idx] for idx in key], self.G)
+			self._subtables[key] = table
+		return table
+
+
+def body_table(system):
+	"""Returns the BodyTable for `system.other_bodies`.
+
+	The table is cached on the system and rebuilt whenever
+	`system.other_bodies` is replaced by a different list.
+	"""
+	table = getattr(system, 'cached_body_table', None)
+	if table is None or table.bodies is not system.other_bodies or table.G != system.G:
+		table = BodyTable(system.other_bodies, system.G)
+		system.cached_body_table = table
+	return table
+
+
+def gravity(pos, body_pos, mu, radius):
+	"""Net gravitational acceleration on projectiles from many bodies.
+
+	pos: array (2,) for one projectile, or (m, 2) for m of them
+	body_pos: array (n, 2), body positions
+	mu: array (n,), G * mass of each body
+	radius: array (n,), radius of each body
+
+	returns: acceleration with the same shape as `pos`, and a boolean
+	(or boolean array (m,)) that is True where a projectile is inside a body
+	"""
+	delta = body_pos - pos[..., None, :]
+	dist2 = np.einsum('...ij,...ij->...i', delta, delta)
+	dist = np.sqrt(dist2)
+	crashed = ~(dist > radius).all(axis=-1)
+	acc = np.matmul((mu / (dist2 * dist))[..., None, :], delta)[..., 0, :]
+	return acc, crashed
+
+
+def projectile_slope_func(projectile, t, system):
+	"""
+	System, must contain an other_bodies property, which is
+	an array of dictionaries containing information about each
+	body, with the following structure:
+
+	Body: {
+		mass: num
+		radius: num
+		position_interpolations: dict
+			x: function
+			y: function
+		positions: TimeFrame
+			x: TimeSeries
+			y: TimeSeries
+	}
+
+	The bodies are packed into a BodyTable (see body_table) the first
+	time they are used.
+
+	This does not check for collisions; run the simulation with
+	collision_event (see run_trajectory) to stop at the surface.
+	"""
+
+	x, y, vx, vy = projectile
+	table = body_table(system)
+
+	acc, _ = gravity(np.array((x, y)), table.positions(t), table.mu, table.radius)
+
+	return vx, vy, acc[0], acc[1]
+
+
+class BodySelector:
+	"""
+	Decides which bodies are worth evaluating in pruned_slope_func.
+
+	Each body is classed from the acceleration it gives the projectile:
+	the one with the largest is DOMINANT, the ones below `threshold` times
+	that are NEGLIGIBLE and skipped, and the rest are PERTURBING.
+
+	Classifying needs every distance, so it is only redone when a
+	conservative bound says a negligible body might no longer be, and in
+	between only the positions of the active bodies are looked up: the
+	distance between the projectile and any body can change by at most
+	how far the projectile has moved plus max_speed times the time elapsed,
+	and the classification stores the largest such change (`budget`) that
+	keeps every negligible body negligible.
+
+	BodySelector: {
+		threshold: num, relative acceleration below which a body is skipped
+		classes: array (n,) of DOMINANT, PERTURBING or NEGLIGIBLE
+		active: array of the indices of the bodies that are evaluated
+		calls: num, times select was called
+		skipped: num, body evaluations skipped
+		classifications: num, times the bodies were classified
+	}
+	"""
+
+	DOMINANT, PERTURBING, NEGLIGIBLE = 0, 1, 2
+
+	def __init__(self, table, threshold):
+		self.table = table
+		self.threshold = threshold
+		self.classes = np.full(len(table), self.PERTURBING)
+		self.active = np.arange(len(table))
+		self.mu = table.mu
+		self.radius = table.radius
+		self._positions = table.positions
+
+		self.calls = 0
+		self.skipped = 0
+		self.classifications = 0
+
+		self._budget = -1.0
+		self._pos = (0.0, 0.0)
+		self._t = 0.0
+
+	def classify(self, pos, t, body_pos):
+		"""Classes every body for the projectile at `pos` at time `t`.
+
+		pos: array (2,), projectile position
+		t: time
+		body_pos: array (n, 2), positions of all bodies at `t`
+		"""
+		table = self.table
+		delta = body_pos - pos
+		dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+		acc = table.mu / dist**2
+
+		dominant = np.argmax(acc)
+		negligible = acc < self.threshold * acc[dominant]
+
+		self.classes = np.full(len(table), self.PERTURBING)
+		self.classes[negligible] = self.NEGLIGIBLE
+		self.classes[dominant] = self.DOMINANT
+
+		self.active = np.flatnonzero(~negligible)
+		self.mu = table.mu[self.active]
+		self.radius = table.radius[self.active]
+		self._positions = table.subtable(self.active).positions
+
+		# largest change in distance that keeps
+		# mu_i / (d_i - change)**2 < threshold * mu_dom / (d_dom + change)**2
+		if negligible.any():
+			root_dom = np.sqrt(self.threshold * table.mu[dominant])
+			root = np.sqrt(table.mu[negligible])
+			self._budget = ((root_dom * dist[negligible] - root * dist[dominant]) / (root + root_dom)).min()
+		else:
+			self._budget = np.inf
+
+		self._pos = (pos[0], pos[1])
+		self._t = t
+		self.classifications += 1
+
+	def select(self, pos, t):
+		"""Looks up the bodies to evaluate, classifying them again first
+		if the bound says it may be needed. Only then are the positions
+		of all the bodies looked up.
+
+		pos: array (2,), projectile position
+		t: time
+
+		returns: array (k, 2), positions at `t` of the bodies in `active`,
+			which go with `mu` and `radius`
+		"""
+		self.calls += 1
+
+		change = math.hypot(pos[0] - self._pos[0], pos[1] - self._pos[1]) + self.table.max_speed * abs(t - self._t)
+		if self._budget >= 0 and change <= self._budget:
+			body_pos = self._positions(t)
+		else:
+			body_pos = self.table.positions(t)
+			self.classify(pos, t, body_pos)
+			body_pos = body_pos[self.active]
+
+		self.skipped += len(self.table) - len(self.active)
+		return body_pos
+
+
+def pruned_slope_func(projectile, t, system):
+	"""
+	Same as projectile_slope_func, but only evaluates the bodies that
+	system.body_selector (a BodySelector for the system's BodyTable)
+	does not class as negligible.
+	"""
+
+	x, y, vx, vy = projectile
+	selector = system.body_selector
+
+	pos = np.array((x, y))
+	body_pos = selector.select(pos, t)
+
+	acc, _ = gravity(pos, body_pos, selector.mu, selector.radius)
+
+	return vx, vy, acc[0], acc[1]
+
+
+def ensemble_slope_func(state, t, system):
+	"""
+	Slope function for m projectiles stacked into one state vector:
+
+	[x0, y0, vx0, vy0, x1, y1, vx1, vy1, ...]
+
+	System must contain other_bodies (see projectile_slope_func) and
+	an ensemble_crashed attribute, a boolean array (m,) with one crash
+	flag per member. A single solver call can't stop for one member, so
+	members that have crashed are carried along at a fake 0.0001 m/s
+	without affecting the others.
+	"""
+
+	state = np.asarray(state, dtype=np.float64).reshape(-1, 4)
+	table = body_table(system)
+
+	acc, hit = gravity(state[:, :2], table.positions(t), table.mu, table.radius)
+
+	crashed = system.ensemble_crashed
+	crashed |= hit
+
+	slopes = np.empty_like(state)
+	slopes[:, :2] = state[:, 2:]
+	slopes[:, 2:] = acc
+	slopes[crashed] = 0.0001
+
+	return slopes.ravel()
+
+
+def surface_distances(state, t, system):
+	"""Distance from the projectile to the surface of each body.
+
+	returns: array (n,), negative inside a body
+	"""
+	table = body_table(system)
+	delta = table.positions(t) - state[:2]
+	return np.sqrt(np.einsum('ij,ij->i', delta, delta)) - table.radius
+
+
+def collision_event(state, t, system):
+	"""Event function that crosses zero, going down, when the
+	projectile reaches the surface of any of system.other_bodies.
+	"""
+	return surface_distances(state, t, system).min()
+
+collision_event.terminal = True
+collision_event.direction = -1
+
+
+class CollisionEvent:
+	"""
+	Same as collision_event, for one run, but only looks up the
+	positions of the bodies in a BodyTable when the projectile might be
+	near one of them.
+
+	After each lookup, the event keeps the projectile's position, the
+	time and the smallest distance to a surface. The distance to any
+	surface can shrink by at most how far the projectile has moved plus
+	max_speed times the time elapsed (the same bound as BodySelector), so
+	until that bound reaches 0 the event returns the bound instead of the
+	distance. The bound is positive only when the distance is, so
+	solve_ivp sees the same signs and finds the same impact.
+
+	Its state is private, so a ResultCache keys it by its class alone.
+	"""
+	terminal = True
+	direction = -1
+
+	def __init__(self, table):
+		self.__name__ = 'collision_event'
+		self._table = table
+		self._distance = -1.0
+		self._pos = (0.0, 0.0)
+		self._t = 0.0
+
+	def __call__(self, state, t, system):
+		x, y = state[0], state[1]
+		table = self._table
+
+		bound = (self._distance - math.hypot(x - self._pos[0], y - self._pos[1])
+				 - table.max_speed * abs(t - self._t))
+		if bound > 0:
+			return bound
+
+		delta = table.positions(t) - (x, y)
+		distance = (np.sqrt(np.einsum('ij,ij->i', delta, delta)) - table.radius).min()
+
+		self._distance = distance
+		self._pos = (x, y)
+		self._t = t
+		return distance
+
+
+def body_positions(body):
+	"""The sampled trajectory of a body.
+
+	For a compressed body (see compress_body) the trajectory is
+	evaluated from its ephemeris at the times it was fitted to.
+
+	returns: TimeFrame with x, y, vx and vy
+	"""
+	if 'positions' in body:
+		return body['positions']
+
+	ephemeris = body['ephemeris']
+	ts = ephemeris.sample_times()
+	return TimeFrame(ephemeris.state(ts), columns=['x', 'y', 'vx', 'vy'], index=ts)
+
+
+def compress_body(body, **options):
+	"""Replaces a body's sampled trajectory and interpolators with a
+	ChebyshevEphemeris, which is much smaller to keep and to pickle.
+
+	body: body dictionary with positions
+	options: passed along to ChebyshevEphemeris.fit
+
+	returns: new body dictionary with mass, radius, name, ephemeris and
+		position_interpolations
+	"""
+	ephemeris = ChebyshevEphemeris.fit(body['positions'], **options)
+	compressed = {key: value for key, value in body.items()
+				  if key not in ('positions', 'position_interpolations')}
+	compressed['ephemeris'] = ephemeris
+	compressed['position_interpolations'] = ephemeris.interpolations()
+	return compressed
+
+
+def body_states(body):
+	"""Interpolation function for the x, y, vx and vy of a body.
+
+	returns: function that maps a scalar time to an array (4,)
+	"""
+	if 'positions' not in body:
+		return body['ephemeris'].state
+
+	positions = body['positions']
+	values = positions[['x', 'y', 'vx', 'vy']].values
+	return stacked_ephemeris(positions.index, values)
+
+
+def periapsis_event(body, terminal=False):
+	"""Makes an event function that crosses zero, going up, each time
+	the projectile passes its closest point to `body`.
+
+	body: body dictionary whose positions include vx and vy
+	terminal: whether to stop the simulation at the first periapsis
+
+	returns: event function
+	"""
+	ephemeris = body_states(body)
+
+	def periapsis(state, t, system):
+		x, y, vx, vy = ephemeris(t)
+		return (state[0] - x) * (state[2] - vx) + (state[1] - y) * (state[3] - vy)
+
+	periapsis.__name__ = f'periapsis_{body["name"]}'
+	periapsis.terminal = terminal
+	periapsis.direction = 1
+	return periapsis
+
+
+def sphere_of_influence_event(body, primary, terminal=False):
+	"""Makes an event function that crosses zero, going down, when
+	the projectile enters the sphere of influence of `body`.
+
+	The radius is the Laplace sphere, a * (m / M)**(2/5), where `a` is the
+	mean distance between `body` and `primary` over its trajectory.
+
+	body: body dictionary
+	primary: body dictionary of what `body` orbits, usually the sun
+	terminal: whether to stop the simulation on entry
+
+	returns: event function
+	"""
+	positions = body_positions(body)
+	primary_positions = body_states(primary)(positions.index.values)
+	a = np.hypot(positions.x.values - primary_positions[:, 0],
+				 positions.y.values - primary_positions[:, 1]).mean()
+	radius = a * (body['mass'] / primary['mass'])**(2/5)
+
+	ephemeris = body_states(body)
+
+	def sphere_of_influence(state, t, system):
+		x, y, _, _ = ephemeris(t)
+		return np.hypot(state[0] - x, state[1] - y) - radius
+
+	sphere_of_influence.__name__ = f'sphere_of_influence_{body["name"]}'
+	sphere_of_influence.terminal = terminal
+	sphere_of_influence.direction = -1
+	return sphere_of_influence
+
+
+def run_trajectory(system, events=(), threshold=None, cache=None, checkpoint=None, **options):
+	"""Runs projectile_slope_func from system.init until the end of
+	system.ts, or until the projectile hits one of system.other_bodies.
+
+	Adds results and events to the System (see modsim.run_events).
+
+	system: System with G, init, ts and other_bodies
+	events: any other event functions to watch for
+	threshold: if given, run pruned_slope_func instead, skipping bodies
+		whose acceleration is below this fraction of the dominant body's;
+		the BodySelector, with its counts, is left in system.body_selector
+	cache: optional ResultCache to look up and store the run in
+	checkpoint: optional directory to integrate the run in windows,
+		resuming or extending the run saved there (see
+		checkpoint.run_segmented); the cache is not used then
+	options: passed along to run_odeint (such as `stats=True`) and solve_ivp
+
+	returns: dictionary with the `body` hit and the time `t`, or None
+	"""
+	slope_func = projectile_slope_func
+	if threshold is not None:
+		system.body_selector = BodySelector(body_table(system), threshold)
+		slope_func = pruned_slope_func
+
+	events = [CollisionEvent(body_table(system))] + list(events)
+	if checkpoint is not None:
+		run_segmented(system, slope_func, checkpoint, events=events, extra=threshold, **options)
+	elif cache is None:
+		run_odeint(system, slope_func, events=events, **options)
+	else:
+		cache.run(system, slope_func, events=events, extra=threshold, **options)
+
+	collisions = system.events[system.events.event == 'collision_event']
+	if len(collisions) == 0:
+		return None
+
+	impact = collisions.iloc[0]
+	state = impact[['x', 'y', 'vx', 'vy']].values.astype(np.float64)
+	idx = np.argmin(surface_distances(state, impact.t, system))
+	return {
+		"body": body_table(system).names[idx],
+		"t": float(impact.t),
+	}
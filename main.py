@@ -1,11 +1,20 @@
 from modsim import *
+from modsim_plot import *
+from gravity import body_positions, compress_body, projectile_slope_func, run_trajectory
+from sweep import run_ensemble, run_parallel
+from nbody import integrate_bodies
+from ephemeris import KeplerEphemeris, KeplerOrbits, is_uniform
+from artifacts import load_bodies, sample_interpolations, save_bodies
+from cache import ResultCache
+from targeting import target_flyby
+from analysis import flyby_analysis
+from porkchop import porkchop_grid, run_porkchop
+from render import animate, frame_positions, have_ffmpeg, make_animation, render_parallel, render_piped
 import matplotlib
-import matplotlib.animation as animation
+import calendar
+import datetime
 import platform
 import sys
-import dill as pickle
-from astropy.time import Time
-from astropy.coordinates import *
 from pdb import set_trace
 
 ##############
@@ -17,50 +26,7 @@ def linear_slope_func(sun, t, system):
 	unpack(system)
 	return vx, vy, 0, 0
 	
-def projectile_slope_func(projectile, t, system):
-	"""
-	System, must contain an other_bodies property, which is
-	an array of dictionaries containing information about each 
-	body, with the following structure:
-
-	Body: {
-		mass: num
-		radius: num
-		position_interpolations: dict
-			x: function
-			y: function
-		positions: TimeFrame
-			x: TimeSeries
-			y: TimeSeries
-	}
-	"""
-
-	x, y, vx, vy = projectile
-	other_bodies = system.other_bodies
-	G = system.G
-	
-	pos = Vector(x, y)
-	acc_net = Vector(0.0,0.0)
-
-	for body in other_bodies:
-		x_body = body["position_interpolations"]['x'](t)
-		y_body = body["position_interpolations"]['y'](t)
-
-		pos_body = Vector(x_body, y_body)
-		distance = pos.dist(pos_body).m
-
-		if distance > body["radius"] and not system.crashed:
-			acc_net += - (G * body["mass"] / (distance**2)) * (pos-pos_body).hat()
-		else:
-			# hit body surface
-			system.crashed = True
-			vx = 0.0001
-			vy = 0.0001
-			acc_net = Vector(0.0001,0.0001)
-
-	return vx, vy, acc_net.x.m, acc_net.y.m
-
-def generate_planet_orbit(x, y, vx, vy, mass, radius, planet_name, sun, system):
+def planet_body(mass, radius, planet_name, positions):
 	"""
 	Returns a dictionary representing a planet and its trajectory:
 
@@ -75,28 +41,108 @@ def generate_planet_orbit(x, y, vx, vy, mass, radius, planet_name, sun, system):
 	}
 	"""
 
-	new_planet = State(x=x, y=y, vx=vx, vy=vy)
-	system.init = new_planet
-	system.other_bodies = [sun]
-
-	run_odeint(system, projectile_slope_func)
-	
 	return {
 		"mass": mass,
 		"radius": radius,
 		"name": planet_name,
 		"position_interpolations": {
-			"x": interpolate(system.results.x),
-			"y": interpolate(system.results.y),
+			"x": interpolate(positions.x),
+			"y": interpolate(positions.y),
 		},
-		"positions": system.results,
+		"positions": positions,
 	}
 
+def generate_planet_orbit(x, y, vx, vy, mass, radius, planet_name, sun, system, cache=None):
+	"""
+	Integrates one planet around the sun and returns it as a
+	dictionary (see planet_body). If a ResultCache is given, an
+	identical earlier integration is reused.
+	"""
+
+	new_planet = State(x=x, y=y, vx=vx, vy=vy)
+	system.init = new_planet
+	system.other_bodies = [sun]
+
+	if cache is None:
+		run_odeint(system, projectile_slope_func)
+	else:
+		cache.run(system, projectile_slope_func)
+	
+	return planet_body(mass, radius, planet_name, system.results)
+
+def generate_planet_orbits(initial_conditions, sun, system, interactions=False):
+	"""
+	Same as calling generate_planet_orbit for every planet, but advances
+	all of them together with a symplectic integrator (see
+	nbody.integrate_bodies), optionally with the planets attracting
+	each other as well as the sun.
+
+	initial_conditions: list of dictionaries with the x, y, vx, vy,
+	mass, radius and planet_name arguments of generate_planet_orbit
+	"""
+
+	init = np.array([[c['x'], c['y'], c['vx'], c['vy']] for c in initial_conditions])
+	mu = system.G * np.array([c['mass'] for c in initial_conditions])
+
+	states = integrate_bodies(init, mu, system.ts, system.G * sun['mass'], interactions=interactions)
+
+	planets = []
+	for idx, c in enumerate(initial_conditions):
+		positions = TimeFrame(states[:, idx, :], columns=['x', 'y', 'vx', 'vy'], index=system.ts)
+		planets.append(planet_body(c['mass'], c['radius'], c['planet_name'], positions))
+
+	return planets
+
+def generate_kepler_planets(initial_conditions, sun, system):
+	"""
+	Same as calling generate_planet_orbit for every planet, but without
+	integrating anything: each planet follows the two-body orbit through
+	its initial conditions, evaluated in closed form whenever it is
+	looked up (see ephemeris.KeplerOrbits).
+
+	initial_conditions: see generate_planet_orbits
+
+	returns: list of body dictionaries with an ephemeris instead of
+	positions, like those from gravity.compress_body
+	"""
+
+	states = [[c['x'], c['y'], c['vx'], c['vy']] for c in initial_conditions]
+	orbits = KeplerOrbits.from_states(states, system.G * sun['mass'], system.ts[0])
+	sample_times = (float(system.ts[0]), float(system.ts[-1]), len(system.ts))
+
+	planets = []
+	for idx, c in enumerate(initial_conditions):
+		ephemeris = KeplerEphemeris(orbits, idx, sample_times)
+		planets.append({
+			"mass": c['mass'],
+			"radius": c['radius'],
+			"name": c['planet_name'],
+			"ephemeris": ephemeris,
+			"position_interpolations": ephemeris.interpolations(),
+		})
+
+	return planets
+
 def generate_planets(system, sun):
-	filepath = 'build/planets.pickle'
+	"""
+	Passing `symplectic` as an argument integrates the planets together
+	(see generate_planet_orbits) instead of one at a time, and passing
+	`interactions` as well makes them attract each other.
+
+	Passing `chebyshev` stores the planets compressed (see
+	gravity.compress_body).
+
+	Passing `kepler` skips the integration and stores each planet's
+	orbital elements (see generate_kepler_planets).
+	"""
+	filepath = 'build/planets.artifact'
 
 	# Regen
 	if ('regen_planets' in sys.argv):
+		# astropy is slow to import, so only load it when we need ephemerides
+		from astropy.time import Time
+		from astropy.coordinates import get_body, get_body_barycentric_posvel, solar_system_ephemeris
+
 		additional_info = {
 			"pluto" : {
 				"mass": np.float64(1.309e22),
@@ -138,219 +184,334 @@ def generate_planets(system, sun):
 
 		# Get initial starting conditions
 		with solar_system_ephemeris.set('de432s'):
-			t = Time('1977-08-20')
+			t = Time(epoch)
 			planet_names = ['mercury', 'venus', 'earth', 'mars', 'jupiter', 'saturn', 'uranus', 'neptune']
-			planets = []
+			initial_conditions = []
 
 			for planet_name in planet_names:
 				helio_pos = get_body(planet_name, t).icrs.cartesian
 				icrs_vel = get_body_barycentric_posvel(planet_name, t)[1]
 
-				print(planet_name)
+				initial_conditions.append({
+					"x": helio_pos.x.si.to_value(), 
+					"y": helio_pos.y.si.to_value(), 
+					"vx": icrs_vel.x.si.to_value(), 
+					"vy": icrs_vel.y.si.to_value(),
+					"mass": additional_info[planet_name]["mass"],
+					"radius": additional_info[planet_name]["radius"],
+					"planet_name": planet_name,
+				})
+
+		if ('kepler' in sys.argv):
+			print('Computing Keplerian orbits')
+			planets = generate_kepler_planets(initial_conditions, sun, system)
+		elif ('symplectic' in sys.argv):
+			print('Integrating all planets together')
+			planets = generate_planet_orbits(initial_conditions, sun, system, interactions=('interactions' in sys.argv))
+		else:
+			planets = []
+			for conditions in initial_conditions:
+				print(conditions["planet_name"])
+				planets.append(generate_planet_orbit(**conditions, sun=sun, system=system, cache=result_cache))
 
-				planets.append(generate_planet_orbit(
-					x = helio_pos.x.si.to_value(), 
-					y = helio_pos.y.si.to_value(), 
-					vx = icrs_vel.x.si.to_value(), 
-					vy = icrs_vel.y.si.to_value(),
-					mass = additional_info[planet_name]["mass"],
-					radius = additional_info[planet_name]["radius"],
-					planet_name = planet_name,
-					sun = sun,
-					system = system
-				))
+		if ('chebyshev' in sys.argv) and ('kepler' not in sys.argv):
+			planets = [compress_body(planet) for planet in planets]
+			for planet in planets:
+				print(f'{planet["name"]}: {len(planet["ephemeris"])} Chebyshev segments, max error {planet["ephemeris"].max_error:.1f} m')
 
-		with open(filepath, 'wb') as file_handle:
-			pickle.dump(planets, file_handle, pickle.HIGHEST_PROTOCOL)
+		save_bodies(filepath, planets)
 
 		return planets
 
-	# Don't regen, read from pickle
+	# Don't regen, map the saved file
 	try:
-		with open(filepath, 'rb') as file_handle:
-			return pickle.load(file_handle)
+		return load_bodies(filepath)
 	except FileNotFoundError as error:
 		print(f'No planets data saved at {filepath}. Rerun this script passing in `regen_planets` as an argument.')
 		exit()
 
+def voyager_body(positions, crashed, impact=None):
+	"""
+	Returns a dictionary representing one voyager run, with the same
+	structure as a planet plus the run's crash flag and, if known,
+	its impact (see gravity.run_trajectory):
+
+	Impact: {
+		body: str
+		t: num
+	}
+
+	Runs that stopped at an impact hold their final position instead
+	of being extrapolated past it. Runs sampled at their solver's steps
+	(see `samples` in sweep_voyager) are interpolated with their
+	velocities (see artifacts.sample_interpolations).
+	"""
+
+	def _interpolate(series):
+		if impact is None:
+			return interpolate(series)
+		return interpolate(series, bounds_error=False, fill_value=(series.iloc[0], series.iloc[-1]))
+
+	return {
+		"mass": 721,
+		"radius":20,
+		"name": "voyager",
+		"crashed": crashed,
+		"impact": impact,
+		"position_interpolations": {
+			"x": _interpolate(positions.x),
+			"y": _interpolate(positions.y),
+		} if is_uniform(positions.index) else sample_interpolations(
+			positions.index.values, positions.x.values, positions.y.values, hold=(impact is not None),
+			vx=positions.vx.values, vy=positions.vy.values),
+		"positions": positions
+	}
+
 def sweep_voyager(vmag, vy0, vyf, num, planets):
-	filepath = 'build/voyager.pickle'
+	"""
+	Passing `ensemble` as an argument integrates all runs together
+	in one solver call (see sweep.run_ensemble), and passing `parallel`
+	spreads them over a pool of processes (see sweep.run_parallel),
+	instead of running them one by one.
+
+	Passing `segmented` integrates each run in windows, checkpointed to
+	build/checkpoints, so an interrupted run resumes where it stopped and
+	a later `end` only integrates the years it adds (see
+	checkpoint.run_segmented).
+
+	Passing `samples=N` keeps N samples of each run computed one by one,
+	spread along the solver's steps so they are dense at the flybys and
+	sparse in between (see modsim.adaptive_times), instead of one per
+	time in `ts`.
+
+	Passing `target` instead searches vy0..vyf for the closest flybys of
+	Jupiter and Saturn (see targeting.target_flyby) and keeps only the
+	best run.
+	"""
+	filepath = 'build/voyager.artifact'
 
 	# Regen
 	if ('regen_voyager' in sys.argv):
+		from astropy.time import Time
+		from astropy.coordinates import get_body
+
 		vy = linspace(vy0,vyf, num)
 		
-		earth = get_body('earth', Time('1977-08-20')).icrs.cartesian
-		runs = []
-
-		for i in range(num):
-			vx = np.sqrt(vmag**2 - vy[i]**2)
+		earth = get_body('earth', Time(epoch)).icrs.cartesian
 
-			print(f'Computing voyager trajectory #{i}: vx: {vx} vy: {vy[i]}')
-			voyager_init = State(
+		def launch_state(vy):
+			vx = np.sqrt(vmag**2 - vy**2)
+			return State(
 				x = earth.x.to_value('m'), 
 				y = earth.y.to_value('m') + 6371e3,
 				vx = vx,
-				vy = vy[i])
-
-			system.init = voyager_init
-			system.other_bodies = planets +[sun]
-			
-			run_odeint(system, projectile_slope_func)
-			runs.append({
-				"mass": 721,
-				"radius":20,
-				"name": "voyager",
-				"position_interpolations": {
-					"x": interpolate(system.results.x),
-					"y": interpolate(system.results.y),
-				},
-				"positions": system.results
-			})
-
-		with open(filepath, 'wb') as file_handle:
-			pickle.dump(runs, file_handle, pickle.HIGHEST_PROTOCOL)
+				vy = vy)
+
+		inits = [launch_state(vy[i]) for i in range(num)]
+
+		system.other_bodies = planets +[sun]
+		runs = []
+
+		if ('target' in sys.argv):
+			print('Searching for the closest Jupiter and Saturn flybys')
+			res = target_flyby(system, launch_state, (vy0, vyf), ['jupiter', 'saturn'], cache=result_cache)
+			print(f'Best vy: {res.x} after {res.nfev} trajectories, closest approaches: {res.closest} m')
+
+			system.init = launch_state(res.x)
+			impact = run_trajectory(system, cache=result_cache)
+			runs.append(voyager_body(system.results, impact is not None, impact))
+		elif ('ensemble' in sys.argv):
+			print(f'Computing {num} voyager trajectories as an ensemble')
+			results, crashed = run_ensemble(system, inits)
+			runs = [voyager_body(positions, bool(flag)) for positions, flag in zip(results, crashed)]
+		elif ('parallel' in sys.argv):
+			print(f'Computing {num} voyager trajectories in parallel')
+			results, impacts = run_parallel(system, inits, cache=result_cache)
+			runs = [voyager_body(positions, impact is not None, impact) for positions, impact in zip(results, impacts)]
+		else:
+			samples = int_argument('samples')
+			for i, voyager_init in enumerate(inits):
+				print(f'Computing voyager trajectory #{i}: vx: {voyager_init.vx} vy: {voyager_init.vy}')
+				system.init = voyager_init
+
+				checkpoint = f'build/checkpoints/voyager_{i}' if ('segmented' in sys.argv) else None
+				impact = run_trajectory(system, cache=result_cache, checkpoint=checkpoint, samples=samples)
+				if impact is not None:
+					print(f'Hit {impact["body"]} at t = {impact["t"]}')
+				runs.append(voyager_body(system.results, impact is not None, impact))
+
+		save_bodies(filepath, runs)
 
 		print('Done computing voyager trajectories')
 		return runs
 	
-	# Don't regen, read from pickle
+	# Don't regen, map the saved file
 	try:
-		with open(filepath, 'rb') as file_handle:
-			return pickle.load(file_handle)
+		return load_bodies(filepath)
 	except FileNotFoundError as error:
 		print(f'No voyager data saved at {filepath}. Rerun this script passing in `regen_voyager` as an argument.')
 		exit()
 
-start_year = 1977
-end_year = 2018
-start_unix = Time(f'{start_year}-01-01').unix
-end_unix = Time(f'{end_year}-01-01').unix
-duration = end_unix - start_unix
-
-system = System(
-	init=None,
-	G=np.float64(6.67408e-11), 
-	ts=linspace(0,duration,10000),
-	crashed=False
-)
-
-sun_frame = TimeFrame({"x": 0, "y": 0, "vx": 0, "vy": 0},[0,1])
-sun = {
-	"mass": 1.989e30,
-	"radius": 695700e3,
-	"name": 'sun',
-	"position_interpolations": {
-		"x": interpolate(sun_frame.x),
-		"y": interpolate(sun_frame.y)
-	},
-	"positions": sun_frame,
-}
+def int_argument(name, default=None):
+	"""Value of a `name=N` command line argument."""
+	for arg in sys.argv:
+		if arg.startswith(f'{name}='):
+			return int(arg[len(name) + 1:])
+	return default
+
+def unix_time(year):
+	"""Same as astropy's Time(f'{year}-01-01').unix, without importing astropy."""
+	return calendar.timegm(datetime.date(year, 1, 1).timetuple())
+
+# the script only runs when main.py is run, not when a worker process of
+# a multiprocessing pool started with spawn or forkserver (the defaults
+# on macOS, and on Linux from Python 3.14) imports it
+if __name__ == '__main__':
+	# passing `end=YEAR` simulates until then instead of 2018; the samples
+	# are those of the original 1977-2018 grid, cut short or continued past
+	# it at the same spacing, so a longer run starts with exactly the same
+	# samples as a shorter one and can extend it (see `segmented`), and the
+	# default is exactly the original grid, so caches and artifacts made
+	# with it stay valid
+	start_year = 1977
+	end_year = int_argument('end', 2018)
+	start_unix = unix_time(start_year)
+	end_unix = unix_time(end_year)
+	duration = end_unix - start_unix
+	base_duration = unix_time(2018) - start_unix
+	base_ts = linspace(0, base_duration, 10000)
+	sample_spacing = base_duration / 9999
+	num_samples = int(round(duration / sample_spacing)) + 1
+
+	# the planets start from their positions on this date, at t = 0, which
+	# is also when the voyager runs launch (see `porkchop` for other dates)
+	epoch = '1977-08-20'
+
+	# integrations are looked up in build/cache unless `nocache` is passed
+	result_cache = None if ('nocache' in sys.argv) else ResultCache('build/cache')
+
+	system = System(
+		init=None,
+		G=np.float64(6.67408e-11), 
+		ts=np.concatenate([
+			base_ts,
+			base_duration + sample_spacing * np.arange(1, num_samples - len(base_ts) + 1),
+		])[:num_samples]
+	)
+
+	sun_frame = TimeFrame({"x": 0, "y": 0, "vx": 0, "vy": 0},[0,1])
+	sun = {
+		"mass": 1.989e30,
+		"radius": 695700e3,
+		"name": 'sun',
+		"position_interpolations": {
+			"x": interpolate(sun_frame.x),
+			"y": interpolate(sun_frame.y)
+		},
+		"positions": sun_frame,
+	}
 		
-planets = generate_planets(system, sun)
-
-runs = sweep_voyager(vmag=44556.31534, vy0=41.0e3, vyf=41.4e3, num=10, planets=planets)
-
-bodies = runs + planets 
-
-##########
-# Graphing
-##########
+	planets = generate_planets(system, sun)
+
+	runs = sweep_voyager(vmag=44556.31534, vy0=41.0e3, vyf=41.4e3, num=10, planets=planets)
+
+	bodies = runs + planets 
+
+	# Passing `flybys` prints and saves where each run passed each planet
+	if ('flybys' in sys.argv):
+		flybys = flyby_analysis(runs, planets, system.G)
+		flybys.to_csv('build/flybys.csv')
+		print(flybys.loc[flybys.groupby(level='body').altitude.idxmin()])
+
+	# Passing `porkchop` sweeps launches over the two years after the planets'
+	# epoch by departure speeds, `grid=N` of each (see porkchop.run_porkchop),
+	# into the same planet orbits, and saves the closest approaches to build/
+	# porkchop.csv and a contour plot of the Jupiter flybys
+	if ('porkchop' in sys.argv):
+		year = 365.25 * 24 * 3600
+		grid_size = int_argument('grid', 50)
+		print(f'Computing a {grid_size}x{grid_size} porkchop sweep')
+		system.other_bodies = planets + [sun]
+		chart = run_porkchop(system, linspace(0, 2 * year, grid_size), linspace(11.5e3, 16e3, grid_size),
+							 flight_time=12 * year, processes=int_argument('processes'))
+		chart.to_csv('build/porkchop.csv')
+
+		fig_porkchop = plt.figure()
+		fig_porkchop.set_size_inches(10, 8)
+		contour(porkchop_grid(chart, 'jupiter_altitude') / 1e9)
+		label_axes(f'Launch (s after {epoch})', 'Departure speed (m/s)', 'Closest approach to Jupiter (million km)')
+		fig_porkchop.savefig('build/porkchop.png')
+
+	##########
+	# Graphing
+	##########
 
-mode = 'update'
-if ('trail' in sys.argv):
-	mode = 'trail'
-if ('update' in sys.argv):
 	mode = 'update'
+	if ('trail' in sys.argv):
+		mode = 'trail'
+	if ('update' in sys.argv):
+		mode = 'update'
 
-# Position
-# ========
+	# Position
+	# ========
 
-def radius_transform(radius):
-	return np.power(radius, 1/4) * 8e8
+	def radius_transform(radius):
+		return np.power(radius, 1/4) * 8e8
 
-limit_distance = 5e12
-colors = ['#009bdf','#e31d3c','#f47920','#ffc20e','#c0d028','#8ebe3f','#349e49','#26aaa5','#6bc1d3','#7b5aa6','#ed037c','#750324','#00677e'] * 1000
+	limit_distance = 5e12
+	colors = ['#009bdf','#e31d3c','#f47920','#ffc20e','#c0d028','#8ebe3f','#349e49','#26aaa5','#6bc1d3','#7b5aa6','#ed037c','#750324','#00677e'] * 1000
 
-# Setup figure
-fig_pos = plt.figure()
-fig_pos.set_dpi(100)
-fig_pos.set_size_inches(20,20)
-plt.title('Gravity Slingshot (position)')
-ax = plt.axes(xlim=(-limit_distance,limit_distance), ylim=(-limit_distance,limit_distance))
-
-# Setup modes
-if (mode == 'update'):
-	for idx, body in enumerate(bodies):
-		color = colors[idx]
-		positions = body['positions']
-
-		circle = plt.Circle((positions.x[0], positions.y[0]), radius_transform(body['radius']), color=color)
-		line, = plt.plot([], [], color)
-
-		ax.add_artist(circle)
-		ax.add_artist(line)
-
-		body['color'] = color
-		body['artists'] = (circle, line)
-if (mode == 'trail'):
 	for idx, body in enumerate(bodies):
 		body['color'] = colors[idx]
 
-# Animation
-def animate(t, bodies, ax):
-	if (mode == 'update'):
-		def _generate(x, y, ax, circle, line):
-			circle.center = (x, y)
-			line_x = np.append(line.get_xdata(), x)
-			line_y = np.append(line.get_ydata(), y)
-			line.set_data(line_x, line_y)
-
-		for body in bodies:
-			interp = body['position_interpolations']
-			circle, line = body['artists']
-			_generate(interp['x'](t), interp['y'](t), ax, circle, line)
-
-		return [body['artists'][1] for body in bodies]
-
-	if (mode == 'trail'):
-		def _generate(x, y, radius, ax, color):
-			ax.add_artist(plt.Circle((x,y), radius, color=color))
-
-		for body in bodies:
-			interp = body['position_interpolations']
-			_generate(interp['x'](t), interp['y'](t), 1e11, ax, body['color'])
-
-		return []
-
-num_frames = 200 if (mode == 'update') else 100
-frames = linspace(0,duration, num_frames)
-ani = animation.FuncAnimation(fig_pos, animate, frames, fargs=(bodies, ax), interval=200, blit=True)
-
-# Save animation
-if (platform.system() == "Darwin"):
-	ani.save(f'build/slingshot_{mode}.gif', writer='imagemagick')
-else:
-	ani.save(f'build/slingshot_{mode}.mp4', writer='ffmpeg')
-
-fig_pos.savefig('build/position.png')
-
-
-# Velocity
-# --------
+	# passing `frames=N` overrides the number of frames
+	num_frames = int_argument('frames', 200 if (mode == 'update') else 100)
+	frames = linspace(0,duration, num_frames)
+
+	# Animation
+	# in trail mode, passing `trail=N` only keeps the last N frames' circles,
+	# `every=N` only leaves a circle every N frames, and `fade` fades them out
+	table = frame_positions(bodies, frames)
+	scene = dict(colors=colors[:len(bodies)], limit=limit_distance, title='Gravity Slingshot (position)',
+				 radii=[radius_transform(body['radius']) for body in bodies], radius=1e11,
+				 length=int_argument('trail'), decimate=int_argument('every', 1), fade=('fade' in sys.argv))
+
+	# Save animation
+	animation_path = f'build/slingshot_{mode}.gif' if (platform.system() == "Darwin") else f'build/slingshot_{mode}.mp4'
+
+	# passing `parallel_render` draws chunks of the frames in a pool of
+	# processes and stitches them together with ffmpeg, and `pipe` streams
+	# the frames straight to ffmpeg while drawing the next ones; without
+	# ffmpeg, both fall back to FuncAnimation.save
+	fig_pos, renderer = make_animation(table, mode, **scene)
+	if ('parallel_render' in sys.argv) and have_ffmpeg():
+		render_parallel(animation_path, table, mode, processes=int_argument('processes'), **scene)
+		renderer(num_frames - 1)
+	elif ('pipe' in sys.argv) and have_ffmpeg():
+		render_piped(animation_path, fig_pos, renderer, range(num_frames))
+	else:
+		ani = animate(fig_pos, renderer, range(num_frames))
+		ani.save(animation_path, writer=('imagemagick' if animation_path.endswith('.gif') else 'ffmpeg'))
+
+	fig_pos.savefig('build/position.png')
+
+
+	# Velocity
+	# --------
  
-def plot_velocity(bodies, name):
-	fig_v = plt.figure()
-	fig_v.set_size_inches(20,20)
-	plt.title(f'Speed ({name})')
+	def plot_velocity(bodies, name):
+		fig_v = plt.figure()
+		fig_v.set_size_inches(20,20)
+		plt.title(f'Speed ({name})')
 
-	for body in bodies:
-		vx = body['positions'].vx
-		vy = body['positions'].vy
-		speed = np.sqrt(vx**2 + vy**2)
-		plt.plot(speed, color=body['color'])
+		for body in bodies:
+			positions = body_positions(body)
+			vx = positions.vx
+			vy = positions.vy
+			speed = np.sqrt(vx**2 + vy**2)
+			plt.plot(speed, color=body['color'])
 
-	fig_v.savefig(f'build/speed_{name}.png')
+		fig_v.savefig(f'build/speed_{name}.png')
 
-plot_velocity([body for body in bodies if body['name'] != 'voyager'], 'planets')
-plot_velocity([body for body in bodies if body['name'] == 'voyager'], 'voyager')
+	plot_velocity([body for body in bodies if body['name'] != 'voyager'], 'planets')
+	plot_velocity([body for body in bodies if body['name'] == 'voyager'], 'voyager')
@@ -14,30 +14,46 @@ import sys
 if sys.version_info < (3, 6):
     logger.warn('modsim.py depends on Python 3.6 features.')
 
+import contextlib
+import functools
+import importlib
 import inspect
-import matplotlib.pyplot as plt
+import types
 import numpy as np
 import pandas as pd
 import scipy
-import sympy
 
-import seaborn as sns
-sns.set(style='white', font_scale=1.5)
-
-import pint
-UNITS = pint.UnitRegistry()
-Quantity = UNITS.Quantity
+# matplotlib, seaborn, sympy and pint take most of the time it takes to
+# import this module, and a simulation needs none of them, so they are
+# only imported when first used: the plotting helpers live in modsim_plot,
+# and the names below are looked up lazily (see _LazyModule at the bottom
+# of this file). scipy.optimize is not deferred, though: scipy.integrate
+# and scipy.interpolate, which a simulation does need, import it
+LAZY_NAMES = {
+    'plt': ('matplotlib.pyplot', None),
+    'sns': ('modsim_plot', 'sns'),
+    'sympy': ('sympy', None),
+    'leastsq': ('scipy.optimize', 'leastsq'),
+    'minimize_scalar': ('scipy.optimize', 'minimize_scalar'),
+}
+
+PLOT_NAMES = ['Simplot', 'SIMPLOT', 'FigureState', 'plot', 'contour',
+              'newfig', 'savefig', 'label_axes', 'xlabel', 'ylabel',
+              'xscale', 'yscale', 'xlim', 'ylim', 'title', 'hlines',
+              'vlines', 'fill_between', 'SubPlots', 'subplots', 'subplot',
+              'legend', 'nolegend', 'remove_from_legend', 'decorate',
+              'plot_segment']
+LAZY_NAMES.update((name, ('modsim_plot', name)) for name in PLOT_NAMES)
 
 # expose some names so we can use them without dot notation
 from copy import copy
 from numpy import sqrt, log, exp, pi
 from pandas import DataFrame, Series
-from time import sleep
+from time import perf_counter, sleep
 
 from scipy.interpolate import interp1d
 from scipy.integrate import odeint
-from scipy.optimize import leastsq
-from scipy.optimize import minimize_scalar
+from scipy.integrate import solve_ivp
 
 
 def linspace(start, stop, num=50, **kwargs):
@@ -123,6 +139,7 @@ def fit_leastsq(error_func, params, data, **kwargs):
     kwargs['full_output'] = True
     
     # run leastsq
+    from scipy.optimize import leastsq
     best_params, _, _, mesg, ier = leastsq(error_func, x0=params, args=args, **kwargs)
 
     #TODO: check why logging.info is not visible
@@ -140,37 +157,175 @@ def fit_leastsq(error_func, params, data, **kwargs):
     return best_params
 
 
-@property
-def dimensionality(self):
-    """Unit's dimensionality (e.g. {length: 1, time: -1})
+_UNITS = None
+
+
+def get_units():
+    """Returns the pint UnitRegistry, building it the first time.
+
+    Building the registry parses pint's whole definitions file, so it
+    is put off until something actually uses units. `UNITS` and
+    `Quantity` are also available as attributes of this module.
+
+    returns: UnitRegistry
+    """
+    global _UNITS
+
+    if _UNITS is None:
+        import pint
+        _UNITS = pint.UnitRegistry()
+    return _UNITS
+
 
-    This is a simplified version of this method that does no caching.
+def is_quantity(value):
+    """Checks whether `value` has units (a pint Quantity or Vector)."""
+    return hasattr(value, 'magnitude') and hasattr(value, 'units')
 
-    returns: dimensionality
+
+@functools.lru_cache(maxsize=None)
+def _conversion_factor(from_units, to_units):
+    return float(get_units().Quantity(1.0, from_units).to(to_units).magnitude)
+
+
+def conversion_factor(from_units, to_units):
+    """Returns the number that converts magnitudes in `from_units`
+    to magnitudes in `to_units`.
+
+    The factor for each pair of units is only worked out once, so
+    converting a whole array costs one multiplication. Only works for
+    units that are multiples of each other (not degC to K).
+
+    from_units: pint Unit or string
+    to_units: pint Unit or string
+
+    returns: float
     """
-    dim = self._REGISTRY._get_dimensionality(self._units)
-    return dim
+    if from_units == to_units:
+        return 1.0
+    return _conversion_factor(str(from_units), str(to_units))
 
-# monkey patch Unit and Quantity so they use the non-caching
-# version of `dimensionality`
-pint.unit._Unit.dimensionality = dimensionality
-pint.quantity._Quantity.dimensionality = dimensionality
 
+class UnitPlan:
+    """Precompiled conversion of the quantities in a System to plain
+    numbers, made by compile_units.
 
-def units_off():
-    """Make all quantities behave as if they were dimensionless.
+    UnitPlan: {
+        params: dict mapping item names to (units, factor)
+        state: dict mapping variables of system.init to (units, factor)
+    }
+
+    `units` are the units the numbers are in once stripped, and
+    `factor` converts the magnitude of the original quantity to them.
     """
-    global SAVED_PINT_METHOD
-    
-    SAVED_PINT_METHOD = UNITS._get_dimensionality
-    UNITS._get_dimensionality = lambda self: {}
 
+    def __init__(self, params, state):
+        self.params = params
+        self.state = state
+
+    def __bool__(self):
+        return bool(self.params or self.state)
+
+    def strip(self, system):
+        """Returns plain numbers for the quantities in `system`.
+
+        returns: dictionary mapping item names to values (with `init`
+                 as a State without units, if it has any quantities)
+        """
+        values = {}
+        for name, (_, factor) in self.params.items():
+            values[name] = _stripped(system[name], factor)
+
+        if self.state:
+            init = system.init
+            values['init'] = State(**{name: _stripped(init[name], self.state[name][1])
+                                      if name in self.state else init[name]
+                                      for name in init.index})
+        return values
+
+    @contextlib.contextmanager
+    def stripped(self, system):
+        """Replaces the quantities in `system` with plain numbers for
+        the duration of a `with` block, then puts them back.
+
+        The System itself is modified rather than copied, so anything
+        the slope function stores on it is kept.
+        """
+        values = self.strip(system)
+        saved = {name: system[name] for name in values}
+        for name, value in values.items():
+            system[name] = value
+        try:
+            yield system
+        finally:
+            for name, value in saved.items():
+                system[name] = value
+
+    def units(self, name):
+        """Returns the units of a state variable or item once stripped,
+        or None if it had none.
+        """
+        if name in self.state:
+            return self.state[name][0]
+        if name in self.params:
+            return self.params[name][0]
+        return None
+
+    def quantities(self, frame):
+        """Attaches units to the columns of a results frame.
+
+        Each column becomes one Quantity array, so this costs about
+        as much as copying the frame.
+
+        frame: DataFrame whose columns are state variables
+
+        returns: dictionary mapping column names to Quantities (or
+                 arrays, for columns without units)
+        """
+        Quantity = get_units().Quantity
+        columns = {}
+        for name in frame.columns:
+            units = self.units(name)
+            values = frame[name].values
+            columns[name] = values if units is None else Quantity(values, units)
+        return columns
+
+
+def _stripped(value, factor):
+    if not is_quantity(value):
+        return value
+    magnitude = value.magnitude
+    return magnitude if factor == 1 else magnitude * factor
+
+
+def compile_units(system, units=None):
+    """Works out, once, how to turn the quantities in a System into
+    plain numbers.
 
-def units_on():
-    """Restore the saved behavior of quantities.
+    system: System, possibly with Quantities among its items and in
+            its `init` State
+    units: optional dictionary mapping item or state variable names to
+           the units they should be converted to; by default each
+           quantity keeps its own units and just loses them
+
+    returns: UnitPlan
     """
-    UNITS._get_dimensionality = SAVED_PINT_METHOD
+    units = units or {}
+
+    def plan(name, value):
+        own = value.units
+        target = units.get(name, own)
+        return target, conversion_factor(own, target)
+
+    params = {name: plan(name, value) for name, value in system.items()
+              if is_quantity(value)}
+
+    state = {}
+    init = system.get('init')
+    if isinstance(init, Series):
+        state = {name: plan(name, value) for name, value in init.items()
+                 if is_quantity(value)}
 
+    return UnitPlan(params, state)
 
 
 def min_bounded(min_func, bounds, *args, **options):
@@ -199,6 +354,7 @@ def min_bounded(min_func, bounds, *args, **options):
         
     underride(options, xatol=1e-3)
     
+    from scipy.optimize import minimize_scalar
     res = minimize_scalar(min_func, 
                           bracket=bounds,
                           bounds=bounds, 
@@ -236,7 +392,117 @@ def max_bounded(max_func, bounds, *args, **options):
     return res
 
 
-def run_odeint(system, slope_func, **kwargs):
+class SlopeCounter:
+    """Wraps a slope function to count and time its calls.
+
+    SlopeCounter: {
+        slope_func: the wrapped function
+        calls: number of calls so far
+        seconds: total time spent in them
+    }
+    """
+
+    def __init__(self, slope_func):
+        self.slope_func = slope_func
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __call__(self, *args):
+        start = perf_counter()
+        try:
+            return self.slope_func(*args)
+        finally:
+            self.calls += 1
+            self.seconds += perf_counter() - start
+
+
+class SolverStats:
+    """Diagnostics of one run of run_odeint, made when it is called
+    with `stats=True`.
+
+    SolverStats: {
+        solver: 'odeint', or the solve_ivp method
+        nfe: number of slope evaluations reported by the solver
+        nje: number of Jacobian evaluations
+        steps: number of steps taken
+        times: array of times reached
+        step_sizes: array of the last step size taken to reach each time
+        methods: array of the method used up to each time, 1 for
+                 Adams (non-stiff) and 2 for BDF (stiff), or None if
+                 the solver doesn't report it
+        switches: number of times the method changed, or None
+        slope_calls: number of calls to the slope function
+        slope_seconds: time spent in the slope function
+        message: the solver's description of how it finished
+    }
+
+    For odeint, `times` are the output times in `ts`; for solve_ivp,
+    they are the end of every step. Neither solver reports rejected
+    steps, but they show up as slope calls that don't lead to a step.
+    """
+
+    def __init__(self, solver, nfe, nje, steps, times, step_sizes, methods,
+                 slope_calls, slope_seconds, message):
+        self.solver = solver
+        self.nfe = nfe
+        self.nje = nje
+        self.steps = steps
+        self.times = times
+        self.step_sizes = step_sizes
+        self.methods = methods
+        self.switches = None if methods is None else int(np.count_nonzero(np.diff(methods)))
+        self.slope_calls = slope_calls
+        self.slope_seconds = slope_seconds
+        self.message = message
+
+    @staticmethod
+    def from_odeint(info, counter):
+        """Makes a SolverStats from the info dictionary returned by odeint
+        with `full_output=True`.
+
+        info: dictionary
+        counter: SlopeCounter the slope function was wrapped in
+        """
+        return SolverStats('odeint', int(info['nfe'][-1]), int(info['nje'][-1]), int(info['nst'][-1]),
+                           info['tcur'], info['hu'], info['mused'],
+                           counter.calls, counter.seconds, info['message'])
+
+    @staticmethod
+    def from_bunch(bunch, method, counter):
+        """Makes a SolverStats from the result of solve_ivp, which must
+        have been called with `dense_output=True`.
+
+        bunch: OdeResult
+        method: string name of the method
+        counter: SlopeCounter the slope function was wrapped in
+        """
+        ts = bunch.sol.ts
+        return SolverStats(method, int(bunch.nfev), int(bunch.njev), len(ts) - 1,
+                           ts[1:], np.diff(ts), None,
+                           counter.calls, counter.seconds, bunch.message)
+
+    def summary(self):
+        """Returns the totals as a Series, for comparing runs (for
+        example as the rows of a SweepFrame).
+        """
+        step_sizes = np.abs(self.step_sizes[self.step_sizes != 0])
+        return Series(dict(
+            nfe=self.nfe,
+            nje=self.nje,
+            steps=self.steps,
+            switches=np.nan if self.switches is None else self.switches,
+            min_step=step_sizes.min() if len(step_sizes) else np.nan,
+            max_step=step_sizes.max() if len(step_sizes) else np.nan,
+            slope_calls=self.slope_calls,
+            slope_seconds=self.slope_seconds,
+            seconds_per_call=self.slope_seconds / self.slope_calls if self.slope_calls else np.nan,
+        ))
+
+    def __repr__(self):
+        return f'SolverStats({self.summary().to_dict()})'
+
+
+def run_odeint(system, slope_func, events=None, stats=False, samples=None, **kwargs):
     """Runs a simulation of the system.
     
     `system` should contain system parameters and `ts`, which
@@ -244,9 +510,19 @@ def run_odeint(system, slope_func, **kwargs):
     solution will be computed.
     
     Adds a DataFrame to the System: results
+
+    If `events` is provided, the simulation is run with
+    scipy.integrate.solve_ivp (LSODA by default) instead of odeint, and
+    also adds a DataFrame to the System: events (see run_events)
     
     system: System object
     slope_func: function that computes slopes
+    events: sequence of event functions (see run_events)
+    stats: if True, also adds a SolverStats to the System: stats
+    samples: if given, the results have this many rows, where the
+             solver took its steps, instead of one per time in `ts`
+             (see run_events)
+    kwargs: passed along to odeint, or to solve_ivp if there are events
     """
     # makes sure `system` contains `ts`
     if not hasattr(system, 'ts'):
@@ -269,20 +545,134 @@ def run_odeint(system, slope_func, **kwargs):
                  the following error:"""
         logger.error(msg)
         raise(e)
+
+    if events or samples:
+        run_events(system, slope_func, events or [], stats=stats, samples=samples, **kwargs)
+        return
+
+    if stats:
+        slope_func = counter = SlopeCounter(slope_func)
     
     # when odeint calls slope_func, it should pass `system` as
     # the third argument.  To make that work, we have to make a
     # tuple with a single element and pass the tuple to odeint as `args`
     args = (system,)
     
+    # odeint only works with plain numbers, so the units come off the
+    # quantities in `system` once, here, rather than on every step;
     # now we're ready to run `odeint` with `init` and `ts` from `system`
-    units_off()
-    array = odeint(slope_func, list(init), ts, args, **kwargs)
-    units_on()
+    with compile_units(system).stripped(system):
+        if stats:
+            array, info = odeint(slope_func, list(system.init), system.ts, args, full_output=True, **kwargs)
+            system.stats = SolverStats.from_odeint(info, counter)
+        else:
+            array = odeint(slope_func, list(system.init), system.ts, args, **kwargs)
+
+        # the return value from odeint is an array, so let's pack it into
+        # a TimeFrame with appropriate columns and index
+        system.results = TimeFrame(array, columns=system.init.index, index=system.ts, dtype=np.float64)
+
+
+def adaptive_times(steps, num, uniform=0.1):
+    """Picks output times that follow the solver's steps.
+
+    The times are spread evenly over a blend of step count and elapsed
+    time, so they are dense where the steps were short (close encounters)
+    and sparse where they were long (cruise), while a fraction `uniform`
+    of them is spread as if they were evenly spaced in time.
+
+    steps: increasing array of the times the solver's steps ended at,
+           starting with the initial time
+    num: number of times to pick
+    uniform: fraction of the times spread evenly in time
+
+    returns: array (num,), starting and ending with those of `steps`
+    """
+    steps = np.asarray(steps, dtype=np.float64)
+    if len(steps) < 2:
+        return steps
+
+    count = np.arange(len(steps)) / (len(steps) - 1)
+    elapsed = (steps - steps[0]) / (steps[-1] - steps[0])
+    measure = (1 - uniform) * count + uniform * elapsed
+    return np.interp(np.linspace(0, 1, num), measure, steps)
+
+
+def run_events(system, slope_func, events, stats=False, samples=None, **options):
+    """Runs a simulation of the system that watches for events.
 
-    # the return value from odeint is an array, so let's pack it into
-    # a TimeFrame with appropriate columns and index
-    system.results = TimeFrame(array, columns=init.index, index=ts, dtype=np.float64)
+    An event function has the same arguments as a slope function,
+    `event(state, t, system)`, and returns a number; an event happens
+    when that number crosses zero, and solve_ivp locates the time by
+    root-finding. Two optional attributes of the function control it:
+
+    terminal: if True (the default), stop the simulation at the event
+    direction: 1 or -1 to only count crossings going up or down,
+               0 (the default) for both
+
+    Adds two DataFrames to the System:
+
+    results: the solution at the times in `ts` up to the end of the
+             simulation, so a simulation stopped by an event has fewer
+             rows than `ts`
+    events: one row per event, in the order they happened, with the
+            event function's name, the time and the state at that time
+
+    system: System object with `init` and `ts`
+    slope_func: function that computes slopes
+    events: sequence of event functions
+    stats: if True, also adds a SolverStats to the System: stats
+    samples: if given, the results have this many rows, at times picked
+             by adaptive_times from the solver's steps, instead of one
+             per time in `ts`
+    options: passed along to solve_ivp
+    """
+    with compile_units(system).stripped(system):
+        _run_events(system, slope_func, events, stats, samples, **options)
+
+
+def _run_events(system, slope_func, events, stats, samples, **options):
+    init = system.init
+    if stats:
+        slope_func = counter = SlopeCounter(slope_func)
+    ts = np.asarray(system.ts, dtype=np.float64)
+
+    def wrap_event(event):
+        wrapped = lambda t, y: event(y, t, system)
+        wrapped.terminal = getattr(event, 'terminal', True)
+        wrapped.direction = getattr(event, 'direction', 0)
+        return wrapped
+
+    # solve_ivp calls functions with (t, y) instead of (y, t, system)
+    f = lambda t, y: slope_func(y, t, system)
+
+    # default to the same method and tolerances as odeint
+    underride(options, method='LSODA', rtol=1.49012e-8, atol=1.49012e-8)
+
+    bunch = solve_ivp(f, (ts[0], ts[-1]), list(init), t_eval=None if samples else ts,
+                      events=[wrap_event(event) for event in events],
+                      dense_output=True, **options)
+
+    if bunch.status == -1:
+        raise Exception(bunch.message)
+
+    if stats:
+        system.stats = SolverStats.from_bunch(bunch, getattr(options['method'], '__name__', options['method']), counter)
+
+    if samples:
+        times = adaptive_times(bunch.sol.ts, samples)
+        system.results = TimeFrame(bunch.sol(times).T, columns=init.index, index=times, dtype=np.float64)
+    else:
+        system.results = TimeFrame(bunch.y.T, columns=init.index, index=bunch.t, dtype=np.float64)
+
+    rows = []
+    for event, times in zip(events, bunch.t_events):
+        name = getattr(event, '__name__', 'event')
+        for t in times:
+            rows.append([name, t] + list(bunch.sol(t)))
+
+    columns = ['event', 't'] + list(init.index)
+    system.events = DataFrame(rows, columns=columns).sort_values('t').reset_index(drop=True)
 
 
 def interpolate(series, **options):
@@ -359,13 +749,26 @@ def fsolve(func, x0, *args, **kwargs):
     # make the tolerance more forgiving than the default
     underride(kwargs, xtol=1e-7)
 
+    # fsolve only works with plain numbers, so strip the units from
+    # x0 and from what func returns
+    def plain_func(x, *args):
+        return _magnitudes(func(x, *args))
+
     # run fsolve
-    units_off()
-    result = scipy.optimize.fsolve(func, x0, args=args, **kwargs)
-    units_on()
+    import scipy.optimize
+    result = scipy.optimize.fsolve(plain_func, _magnitudes(x0), args=args, **kwargs)
     return result
 
 
+def _magnitudes(value):
+    """Magnitude of a quantity, or of each quantity in a sequence."""
+    if is_quantity(value):
+        return value.magnitude
+    if isinstance(value, (list, tuple)):
+        return [_magnitudes(elt) for elt in value]
+    return value
+
+
 def underride(d, **options):
     """Add key-value pairs to d only if key is not in d.
 
@@ -383,308 +786,6 @@ def underride(d, **options):
     return d
 
 
-class Simplot:
-    """Provides a simplified interface to matplotlib."""
-
-    def __init__(self):
-        """Initializes the instance variables."""
-        # map from Figure to FigureState
-        self.figure_states = dict()
-        
-    def get_figure_state(self, figure=None):
-        """Gets the state of the current figure.
-
-        figure: Figure
-
-        returns: FigureState object
-        """
-        if figure is None:
-            figure = plt.gcf()
-        
-        try:
-            return self.figure_states[figure]
-        except KeyError:
-            figure_state = FigureState()
-            self.figure_states[figure] = figure_state
-            return figure_state
-    
-SIMPLOT = Simplot()
-
-
-class FigureState:
-    """Encapsulates information about the current figure."""
-    def __init__(self):
-        # map from style tuple to Lines object
-        self.lines = dict()
-        
-    def get_line(self, style, kwargs):
-        """Gets the line object for a given style tuple.
-
-        style: Matplotlib style string
-        kwargs: dictionary of style options
-
-        returns: maplotlib.lines.Lines2D
-        """
-        color = kwargs.get('color')
-        key = style, color
-
-        # if there's no style or color, make a new line,
-        # and don't store it for future updating.
-        if key == (None, None):
-            return self.make_line(style, kwargs)
-
-        # otherwise try to look it up, and if it's
-        # not there, make a new line and store it.
-        try:
-            return self.lines[key]
-        except KeyError:
-            line = self.make_line(style, kwargs)
-            self.lines[key] = line
-            return line
-    
-    def make_line(self, style, kwargs):
-        underride(kwargs, linewidth=3, alpha=0.6)
-        if style is None:
-            lines = plt.plot([], **kwargs)
-        else:
-            lines = plt.plot([], style, **kwargs)
-        return lines[0]
-
-    def clear_lines(self):
-        self.lines = dict()
-
-
-# TODO: Split plot into simplot(), which adds points to existing lines,
-# and plot(), which does not
-        
-def plot(*args, **kwargs):
-    """Makes line plots.
-    
-    args can be:
-      plot(y)
-      plot(y, style_string)
-      plot(x, y)
-      plot(x, y, style_string)
-    
-    kwargs are the same as for pyplot.plot
-    
-    If x or y have attributes label and/or units,
-    label the axes accordingly.
-    
-    """
-    update = kwargs.pop('update', False)
-
-    x = None
-    y = None
-    style = None
-    
-    # parse the args the same way plt.plot does:
-    # 
-    if len(args) == 1:
-        y = args[0]
-    elif len(args) == 2:
-        if isinstance(args[1], str):
-            y, style = args
-        else:
-            x, y = args
-    elif len(args) == 3:
-        x, y, style = args
-
-    if 'style' in kwargs:
-        style = kwargs.pop('style')
-
-    # get the current line, based on style and kwargs,
-    # or create a new empty line
-    figure = plt.gcf()
-    figure_state = SIMPLOT.get_figure_state(figure)
-    line = figure_state.get_line(style, kwargs)
-    
-    # append y to ydata
-    if update:
-        ys = np.asarray(y)
-    else:
-        ys = line.get_ydata()
-        ys = np.append(ys, y)
-    line.set_ydata(ys)
-
-    # update xdata
-    xs = line.get_xdata()
-
-    if x is None:
-        # see if y is something like a Series that has an index
-        if hasattr(y, 'index'):
-            x = y.index
-
-    # if we still don't have an x, increment the last element of xs  
-    if x is None:
-        try:
-            x = xs[-1] + 1
-        except IndexError:
-            x = 0
-
-    if update:
-        xs = np.asarray(x)
-    else:
-        xs = np.append(xs, x)
-    line.set_xdata(xs)
-    
-    #print(line.get_xdata())
-    #print(line.get_ydata())
-    
-    axes = plt.gca()
-    axes.relim()
-    axes.autoscale_view(True, True, True)
-    axes.margins(0.02)
-    figure.canvas.draw()
-    
-
-def contour(df, **options):
-    """Makes a contour plot from a DataFrame.
-
-    Note: columns and index must be numerical
-
-    df: DataFrame
-    """
-    x = results.columns
-    y = results.index
-    X, Y = np.meshgrid(x, y)
-    cs = plt.contour(X, Y, results, **options)
-    plt.clabel(cs, inline=1, fontsize=10)
-
-
-def newfig(**kwargs):
-    """Creates a new figure."""
-    fig = plt.figure()
-    fig.set(**kwargs)
-    fig.canvas.draw()
-
-
-def savefig(filename, *args, **kwargs):
-    """Save the current figure.
-
-    filename: string
-    """
-    print('Saving figure to file', filename)
-    return plt.savefig(filename, *args, **kwargs)
-
-    
-def label_axes(xlabel=None, ylabel=None, title=None, **kwargs):
-    """Puts labels and title on the axes.
-
-    xlabel: string
-    ylabel: string
-    title: string
-
-    kwargs: options passed to pyplot
-    """
-    ax = plt.gca()
-    ax.set_ylabel(ylabel, **kwargs)
-    ax.set_xlabel(xlabel, **kwargs)
-    if title is not None:
-        ax.set_title(title, **kwargs)
-
-    # TODO: consider setting labels automatically based on
-    # object attributes
-    # label the y axis
-    #label = getattr(y, 'label', 'y')
-    #units = getattr(y, 'units', 'dimensionless')
-    #plt.ylabel('%s (%s)' % (label, units))
-
-xlabel = plt.xlabel
-ylabel = plt.ylabel
-xscale = plt.xscale
-yscale = plt.yscale
-xlim = plt.xlim
-ylim = plt.ylim
-title = plt.title
-hlines = plt.hlines
-vlines = plt.vlines
-fill_between = plt.fill_between
-
-class SubPlots:
-
-    def __init__(self, fig, axes_seq):
-        self.fig = fig
-        self.axes_seq = axes_seq
-        self.current_axes_index = 0
-
-    def current_axes():
-        return self.axes_seq(self.current_axes_index)
-
-    # TODO: consider making SubPlots iterable
-    def next_axes(self):
-        self.current_axes_index += 1
-        return current_axes()
-
-
-def subplots(*args, **kwargs):
-    fig, axes_seq = plt.subplots(*args, **kwargs)
-    return SubPlots(fig, axes_seq)
-
-
-def subplot(nrows, ncols, plot_number, **kwargs):
-    figsize = {(2, 1): (8, 8),
-               (3, 1): (8, 10)}
-    key = nrows, ncols
-    default = (8, 5.5)
-    width, height = figsize.get(key, default)
-    
-    plt.subplot(nrows, ncols, plot_number, **kwargs)
-    fig = plt.gcf()
-    fig.set_figwidth(width)
-    fig.set_figheight(height)
-
-
-def legend(**kwargs):
-    underride(kwargs, loc='best')
-    plt.legend(**kwargs)
-
-
-def nolegend():
-    # TODO
-    pass
-
-
-def remove_from_legend(bad_labels):
-    """Removes some labels from the legend.
-
-    bad_labels: sequence of strings
-    """
-    ax = plt.gca()
-    handles, labels = ax.get_legend_handles_labels()
-    handle_list, label_list = [], []
-    for handle, label in zip(handles, labels):
-        if label not in bad_labels:
-            handle_list.append(handle)
-            label_list.append(label)
-    plt.legend(handle_list, label_list)
-
-
-def decorate(**kwargs):
-    """Decorate the current axes.
-
-    Call decorate with keyword arguments like
-
-    decorate(title='Title',
-             xlabel='x',
-             ylabel='y')
-
-    The keyword arguments can be any of the axis properties
-    defined by Matplotlib.  To see the list, run plt.getp(plt.gca())
-
-    In addition, you can use `legend=False` to suppress the legend.
-
-    And you can use `loc` to indicate the location of the legend
-    (the default value is 'best')
-    """
-    # 
-    if kwargs.pop('legend', True):
-        loc = kwargs.pop('loc', 'best')
-        legend(loc=loc)
-    
-    plt.gca().set(**kwargs)
-
-
 class Array(np.ndarray):
     pass
 
@@ -848,7 +949,7 @@ class SweepFrame(MyDataFrame):
     pass
 
 
-class _Vector(Quantity):
+class _VectorMethods:
     """Represented as a Pint Quantity with a NumPy array
     
     x, y, z, mag, mag2, and angle are accessible as attributes.
@@ -933,6 +1034,20 @@ class _Vector(Quantity):
         else:
             #TODO: see http://www.euclideanspace.com/maths/algebra/vectors/angleBetween/
             raise NotImplementedError()
+
+
+_VECTOR = None
+
+
+def _vector_class():
+    """Returns the Vector class, which can only be made once there is
+    a unit registry to subclass its Quantity.
+    """
+    global _VECTOR
+
+    if _VECTOR is None:
+        _VECTOR = type('_Vector', (_VectorMethods, get_units().Quantity), {})
+    return _VECTOR
         
         
 def Vector(*args, units=None):
@@ -958,21 +1073,224 @@ def Vector(*args, units=None):
     if units is not None:
         found_units = units
     
-    return _Vector(args, found_units)
+    return _vector_class()(args, found_units)
 
 
-def plot_segment(A, B, **options):
-    """Plots a line segment between two Vectors.
+class VectorArray:
+    """A batch of 2-D or 3-D vectors stored in one float64 array.
 
-    Additional options are passed along to plot().
+    This is a unit-free alternative to Vector for inner loops: the
+    vectors are the rows of an array with shape (..., 2) or (..., 3),
+    and every operation works on the whole batch at once, without
+    making an object (or doing any unit bookkeeping) per vector.
 
-    A: Vector
-    B: Vector
+    Use from_quantity and to_quantity to convert at the boundary with
+    code that uses units.
     """
-    xs = A.x, B.x
-    ys = A.y, B.y
-    plot(xs, ys, **options)
-    
+    __slots__ = ('array',)
+
+    # make NumPy defer to our operators, so `array * vectors` scales
+    __array_ufunc__ = None
+
+    def __init__(self, *args):
+        """Initializes the array.
+
+        args: one array-like with shape (..., 2) or (..., 3), or the
+              components as separate numbers or arrays (x, y or x, y, z)
+
+        A float64 array is used as is, not copied, so in-place operators
+        like += also change it.
+        """
+        if len(args) == 1:
+            array = np.asarray(args[0], dtype=np.float64)
+        else:
+            array = np.stack(np.broadcast_arrays(*args), axis=-1).astype(np.float64)
+
+        if array.ndim == 0 or array.shape[-1] not in (2, 3):
+            msg = """VectorArray needs an array whose last axis has
+                     2 or 3 components, but got shape %s.""" % (array.shape,)
+            raise ValueError(msg)
+        self.array = array
+
+    @classmethod
+    def from_quantity(cls, quantity, units=None):
+        """Strips the units from a Quantity (or Vector).
+
+        quantity: Quantity with shape (..., 2) or (..., 3)
+        units: units to express the magnitudes in; defaults to the
+               quantity's own units
+
+        returns: VectorArray, units
+        """
+        if units is None:
+            units = quantity.units
+        else:
+            quantity = quantity.to(units)
+        return cls(quantity.magnitude), units
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        """Stacks a sequence of Vectors (or other sequences of components).
+
+        returns: VectorArray with one row per vector
+        """
+        return cls([getattr(vector, 'magnitude', vector) for vector in vectors])
+
+    def to_quantity(self, units):
+        """Attaches units to the array.
+
+        units: pint Unit or string
+
+        returns: Quantity with the shape of the array
+        """
+        return get_units().Quantity(self.array, units)
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        return VectorArray(self.array[index])
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.array
+        return self.array.astype(dtype)
+
+    def __repr__(self):
+        return 'VectorArray(%r)' % (self.array,)
+
+    @property
+    def shape(self):
+        """Shape of the batch, not counting the components."""
+        return self.array.shape[:-1]
+
+    @property
+    def x(self):
+        """Returns the x components."""
+        return self.array[..., 0]
+
+    @property
+    def y(self):
+        """Returns the y components."""
+        return self.array[..., 1]
+
+    @property
+    def z(self):
+        """Returns the z components."""
+        return self.array[..., 2]
+
+    @property
+    def mag2(self):
+        """Returns the squared magnitudes."""
+        return np.einsum('...i,...i->...', self.array, self.array)
+
+    @property
+    def mag(self):
+        """Returns the magnitudes."""
+        return np.sqrt(self.mag2)
+
+    @property
+    def angle(self):
+        """Returns the angles between the vectors and the positive x axis."""
+        return np.arctan2(self.y, self.x)
+
+    def polar(self):
+        """Returns magnitudes and angles."""
+        return self.mag, self.angle
+
+    def hat(self):
+        """Returns the unit vectors in the directions of the vectors."""
+        return VectorArray(self.array / self.mag[..., None])
+
+    def perp(self):
+        """Returns perpendicular vectors (rotated left).
+
+        Only works with 2-D vectors.
+        """
+        assert self.array.shape[-1] == 2
+        return VectorArray(-self.y, self.x)
+
+    def dot(self, other):
+        """Returns the dot products of the vectors with other."""
+        return np.einsum('...i,...i->...', self.array, _components(other))
+
+    def cross(self, other):
+        """Returns the cross products of the vectors with other.
+
+        For 2-D vectors, returns the z components of the cross products.
+        """
+        other = _components(other)
+        if self.array.shape[-1] == 2:
+            return self.x * other[..., 1] - self.y * other[..., 0]
+        return VectorArray(np.cross(self.array, other))
+
+    def proj(self, other):
+        """Returns the projections of the vectors onto other."""
+        other = VectorArray(_components(other))
+        return other * (self.dot(other) / other.mag2)
+
+    def comp(self, other):
+        """Returns the magnitudes of the projections onto other."""
+        return self.dot(VectorArray(_components(other)).hat())
+
+    def dist(self, other):
+        """Returns the Euclidean distances from the vectors to other."""
+        return (self - other).mag
+
+    def diff_angle(self, other):
+        """Angular differences between the vectors and other, in radians.
+        """
+        if self.array.shape[-1] == 2:
+            return self.angle - VectorArray(_components(other)).angle
+        else:
+            raise NotImplementedError()
+
+    def __add__(self, other):
+        return VectorArray(self.array + _components(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return VectorArray(self.array - _components(other))
+
+    def __rsub__(self, other):
+        return VectorArray(_components(other) - self.array)
+
+    def __iadd__(self, other):
+        self.array += _components(other)
+        return self
+
+    def __isub__(self, other):
+        self.array -= _components(other)
+        return self
+
+    def __neg__(self):
+        return VectorArray(-self.array)
+
+    def __mul__(self, factor):
+        """Scales the vectors by a number, or by one number per vector."""
+        return VectorArray(self.array * _scale(factor))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, factor):
+        return VectorArray(self.array / _scale(factor))
+
+
+def _components(other):
+    """Array of components of a VectorArray, Vector or array-like."""
+    if isinstance(other, VectorArray):
+        return other.array
+    return np.asarray(getattr(other, 'magnitude', other), dtype=np.float64)
+
+
+def _scale(factor):
+    """Makes per-vector factors broadcast over the components."""
+    factor = np.asarray(factor, dtype=np.float64)
+    if factor.ndim == 0:
+        return factor
+    return factor[..., None]
+
 
 def cart2pol(x, y, z=None):
     """Convert Cartesian coordinates to polar.
@@ -1005,9 +1323,10 @@ def pol2cart(theta, rho, z=None):
     returns: x, y OR x, y, z
     """
     if hasattr(theta, 'units'):
-        if theta.units == UNITS.degree:
-            theta = theta.to(UNITS.radian)
-        if theta.units != UNITS.radian:
+        units = get_units()
+        if theta.units == units.degree:
+            theta = theta.to(units.radian)
+        if theta.units != units.radian:
             msg = """In pol2cart, theta must be either a number or
             a Quantity in degrees or radians."""
             raise ValueError(msg)
@@ -1020,3 +1339,29 @@ def pol2cart(theta, rho, z=None):
     else:
         return x, y, z
 
+
+class _LazyModule(types.ModuleType):
+    """Module type that provides LAZY_NAMES, UNITS and Quantity on
+    first access (module-level __getattr__ needs Python 3.7).
+    """
+
+    def __getattr__(self, name):
+        if name == 'UNITS':
+            value = get_units()
+        elif name == 'Quantity':
+            value = get_units().Quantity
+        elif name == '_Vector':
+            value = _vector_class()
+        elif name in LAZY_NAMES:
+            module_name, attribute = LAZY_NAMES[name]
+            value = importlib.import_module(module_name)
+            if attribute is not None:
+                value = getattr(value, attribute)
+        else:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+        setattr(self, name, value)
+        return value
+
+
+sys.modules[__name__].__class__ = _LazyModule
@@ -0,0 +1,335 @@
+"""
+Plotting helpers from Modeling and Simulation in Python.
+
+Copyright 2017 Allen Downey
+
+License: https://creativecommons.org/licenses/by/4.0)
+
+These used to live in modsim.py; they are split out so that simulation
+code can import modsim without loading matplotlib and seaborn. They are
+still available as attributes of modsim.
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+import seaborn as sns
+sns.set(style='white', font_scale=1.5)
+
+from modsim import underride
+
+
+class Simplot:
+    """Provides a simplified interface to matplotlib."""
+
+    def __init__(self):
+        """Initializes the instance variables."""
+        # map from Figure to FigureState
+        self.figure_states = dict()
+        
+    def get_figure_state(self, figure=None):
+        """Gets the state of the current figure.
+
+        figure: Figure
+
+        returns: FigureState object
+        """
+        if figure is None:
+            figure = plt.gcf()
+        
+        try:
+            return self.figure_states[figure]
+        except KeyError:
+            figure_state = FigureState()
+            self.figure_states[figure] = figure_state
+            return figure_state
+    
+SIMPLOT = Simplot()
+
+
+class FigureState:
+    """Encapsulates information about the current figure."""
+    def __init__(self):
+        # map from style tuple to Lines object
+        self.lines = dict()
+        
+    def get_line(self, style, kwargs):
+        """Gets the line object for a given style tuple.
+
+        style: Matplotlib style string
+        kwargs: dictionary of style options
+
+        returns: maplotlib.lines.Lines2D
+        """
+        color = kwargs.get('color')
+        key = style, color
+
+        # if there's no style or color, make a new line,
+        # and don't store it for future updating.
+        if key == (None, None):
+            return self.make_line(style, kwargs)
+
+        # otherwise try to look it up, and if it's
+        # not there, make a new line and store it.
+        try:
+            return self.lines[key]
+        except KeyError:
+            line = self.make_line(style, kwargs)
+            self.lines[key] = line
+            return line
+    
+    def make_line(self, style, kwargs):
+        underride(kwargs, linewidth=3, alpha=0.6)
+        if style is None:
+            lines = plt.plot([], **kwargs)
+        else:
+            lines = plt.plot([], style, **kwargs)
+        return lines[0]
+
+    def clear_lines(self):
+        self.lines = dict()
+
+
+# TODO: Split plot into simplot(), which adds points to existing lines,
+# and plot(), which does not
+        
+def plot(*args, **kwargs):
+    """Makes line plots.
+    
+    args can be:
+      plot(y)
+      plot(y, style_string)
+      plot(x, y)
+      plot(x, y, style_string)
+    
+    kwargs are the same as for pyplot.plot
+    
+    If x or y have attributes label and/or units,
+    label the axes accordingly.
+    
+    """
+    update = kwargs.pop('update', False)
+
+    x = None
+    y = None
+    style = None
+    
+    # parse the args the same way plt.plot does:
+    # 
+    if len(args) == 1:
+        y = args[0]
+    elif len(args) == 2:
+        if isinstance(args[1], str):
+            y, style = args
+        else:
+            x, y = args
+    elif len(args) == 3:
+        x, y, style = args
+
+    if 'style' in kwargs:
+        style = kwargs.pop('style')
+
+    # get the current line, based on style and kwargs,
+    # or create a new empty line
+    figure = plt.gcf()
+    figure_state = SIMPLOT.get_figure_state(figure)
+    line = figure_state.get_line(style, kwargs)
+    
+    # append y to ydata
+    if update:
+        ys = np.asarray(y)
+    else:
+        ys = line.get_ydata()
+        ys = np.append(ys, y)
+    line.set_ydata(ys)
+
+    # update xdata
+    xs = line.get_xdata()
+
+    if x is None:
+        # see if y is something like a Series that has an index
+        if hasattr(y, 'index'):
+            x = y.index
+
+    # if we still don't have an x, increment the last element of xs  
+    if x is None:
+        try:
+            x = xs[-1] + 1
+        except IndexError:
+            x = 0
+
+    if update:
+        xs = np.asarray(x)
+    else:
+        xs = np.append(xs, x)
+    line.set_xdata(xs)
+    
+    #print(line.get_xdata())
+    #print(line.get_ydata())
+    
+    axes = plt.gca()
+    axes.relim()
+    axes.autoscale_view(True, True, True)
+    axes.margins(0.02)
+    figure.canvas.draw()
+    
+
+def contour(df, **options):
+    """Makes a contour plot from a DataFrame.
+
+    Note: columns and index must be numerical
+
+    df: DataFrame
+    """
+    x = df.columns
+    y = df.index
+    X, Y = np.meshgrid(x, y)
+    cs = plt.contour(X, Y, df, **options)
+    plt.clabel(cs, inline=1, fontsize=10)
+
+
+def newfig(**kwargs):
+    """Creates a new figure."""
+    fig = plt.figure()
+    fig.set(**kwargs)
+    fig.canvas.draw()
+
+
+def savefig(filename, *args, **kwargs):
+    """Save the current figure.
+
+    filename: string
+    """
+    print('Saving figure to file', filename)
+    return plt.savefig(filename, *args, **kwargs)
+
+    
+def label_axes(xlabel=None, ylabel=None, title=None, **kwargs):
+    """Puts labels and title on the axes.
+
+    xlabel: string
+    ylabel: string
+    title: string
+
+    kwargs: options passed to pyplot
+    """
+    ax = plt.gca()
+    ax.set_ylabel(ylabel, **kwargs)
+    ax.set_xlabel(xlabel, **kwargs)
+    if title is not None:
+        ax.set_title(title, **kwargs)
+
+    # TODO: consider setting labels automatically based on
+    # object attributes
+    # label the y axis
+    #label = getattr(y, 'label', 'y')
+    #units = getattr(y, 'units', 'dimensionless')
+    #plt.ylabel('%s (%s)' % (label, units))
+
+xlabel = plt.xlabel
+ylabel = plt.ylabel
+xscale = plt.xscale
+yscale = plt.yscale
+xlim = plt.xlim
+ylim = plt.ylim
+title = plt.title
+hlines = plt.hlines
+vlines = plt.vlines
+fill_between = plt.fill_between
+
+class SubPlots:
+
+    def __init__(self, fig, axes_seq):
+        self.fig = fig
+        self.axes_seq = axes_seq
+        self.current_axes_index = 0
+
+    def current_axes():
+        return self.axes_seq(self.current_axes_index)
+
+    # TODO: consider making SubPlots iterable
+    def next_axes(self):
+        self.current_axes_index += 1
+        return current_axes()
+
+
+def subplots(*args, **kwargs):
+    fig, axes_seq = plt.subplots(*args, **kwargs)
+    return SubPlots(fig, axes_seq)
+
+
+def subplot(nrows, ncols, plot_number, **kwargs):
+    figsize = {(2, 1): (8, 8),
+               (3, 1): (8, 10)}
+    key = nrows, ncols
+    default = (8, 5.5)
+    width, height = figsize.get(key, default)
+    
+    plt.subplot(nrows, ncols, plot_number, **kwargs)
+    fig = plt.gcf()
+    fig.set_figwidth(width)
+    fig.set_figheight(height)
+
+
+def legend(**kwargs):
+    underride(kwargs, loc='best')
+    plt.legend(**kwargs)
+
+
+def nolegend():
+    # TODO
+    pass
+
+
+def remove_from_legend(bad_labels):
+    """Removes some labels from the legend.
+
+    bad_labels: sequence of strings
+    """
+    ax = plt.gca()
+    handles, labels = ax.get_legend_handles_labels()
+    handle_list, label_list = [], []
+    for handle, label in zip(handles, labels):
+        if label not in bad_labels:
+            handle_list.append(handle)
+            label_list.append(label)
+    plt.legend(handle_list, label_list)
+
+
+def decorate(**kwargs):
+    """Decorate the current axes.
+
+    Call decorate with keyword arguments like
+
+    decorate(title='Title',
+             xlabel='x',
+             ylabel='y')
+
+    The keyword arguments can be any of the axis properties
+    defined by Matplotlib.  To see the list, run plt.getp(plt.gca())
+
+    In addition, you can use `legend=False` to suppress the legend.
+
+    And you can use `loc` to indicate the location of the legend
+    (the default value is 'best')
+    """
+    # 
+    if kwargs.pop('legend', True):
+        loc = kwargs.pop('loc', 'best')
+        legend(loc=loc)
+    
+    plt.gca().set(**kwargs)
+
+
+def plot_segment(A, B, **options):
+    """Plots a line segment between two Vectors.
+
+    Additional options are passed along to plot().
+
+    A: Vector
+    B: Vector
+    """
+    xs = A.x, B.x
+    ys = A.y, B.y
+    plot(xs, ys, **options)
+    
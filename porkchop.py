@@ -0,0 +1,187 @@
+"""
+Porkchop sweeps: a grid of launch dates by departure speeds (and,
+optionally, departure angles), one voyager run per cell, summarized by
+how close each run came to a few target bodies.
+
+Every cell launches into the same planetary ephemeris, which is published
+once to a memory-mapped file (see sweep.publish_bodies), so a later
+launch date only needs an ephemeris that runs long enough, not one of
+its own.
+"""
+
+import math
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from modsim import State, SweepFrame, System
+from gravity import body_positions, body_states, periapsis_event, run_trajectory
+from sweep import mapped_bodies, publish_bodies, shared_path
+from targeting import closest_approaches
+
+
+def launch_state(earth_states, radius, t, speed, angle=0.0):
+	"""Leaving the surface of the earth at `t`.
+
+	The projectile has the earth's velocity plus `speed`, in the earth's
+	direction of motion turned by `angle` radians (counterclockwise), and
+	starts on the surface in that same direction.
+
+	earth_states: function that maps a time to the earth's x, y, vx, vy
+		(see gravity.body_states)
+	radius: radius of the earth
+	t: launch time
+	speed: departure speed relative to the earth
+	angle: departure direction relative to the earth's motion
+
+	returns: State with x, y, vx and vy
+	"""
+	x, y, vx, vy = earth_states(t)
+	heading = math.atan2(vy, vx) + angle
+	c, s = math.cos(heading), math.sin(heading)
+	return State(x=x + radius * c, y=y + radius * s, vx=vx + speed * c, vy=vy + speed * s)
+
+
+def porkchop_columns(targets):
+	"""Names of the columns run_porkchop fills in, in order."""
+	columns = []
+	for name in targets:
+		columns += [f'{name}_altitude', f'{name}_flight']
+	return columns + ['final_speed', 'crashed']
+
+
+# state of each worker process in run_porkchop
+_worker = {}
+
+
+def _init_worker(ephemeris_path, specs, G, earth, targets, flight_ts, options):
+	bodies = mapped_bodies(ephemeris_path, specs)
+	by_name = {body['name']: body for body in bodies}
+	targets = [by_name[name] for name in targets]
+
+	_worker['system'] = System(init=None, G=G, ts=flight_ts, other_bodies=bodies)
+	_worker['earth'] = body_states(by_name[earth])
+	_worker['radius'] = by_name[earth]['radius']
+	_worker['targets'] = targets
+	_worker['events'] = [periapsis_event(body) for body in targets]
+	_worker['flight_ts'] = flight_ts
+	_worker['options'] = options
+
+
+def _run_cell(task):
+	cell, (t, speed, angle) = task
+	system = _worker['system']
+	system.init = launch_state(_worker['earth'], _worker['radius'], t, speed, angle)
+	system.ts = t + _worker['flight_ts']
+
+	impact = run_trajectory(system, events=_worker['events'], **_worker['options'])
+	altitudes, times = closest_approaches(system, _worker['targets'])
+
+	_, _, vx, vy = system.results.values[-1]
+	final_speed = math.nan if impact is not None else math.hypot(vx, vy)
+
+	row = np.empty(2 * len(altitudes) + 2)
+	row[0:-2:2] = altitudes
+	row[1:-2:2] = times - t
+	row[-2:] = final_speed, impact is not None
+	return cell, row
+
+
+def run_porkchop(system, launch_times, speeds, angles=(0.0,), targets=('jupiter', 'saturn'), flight_time=None,
+				 points=200, earth='earth', processes=None, directory='build', chunksize=None, **options):
+	"""Runs one voyager trajectory per launch time, departure speed and
+	departure angle (see launch_state), in a pool of worker processes.
+
+	The bodies in `system.other_bodies` are published once to a file in
+	`directory` that every worker memory-maps (see sweep.run_parallel),
+	removed when the sweep is done, and must cover every launch time plus
+	`flight_time`. Each run watches for its periapsis with every target
+	(see gravity.periapsis_event), so its closest approaches are exact
+	however few `points` it keeps.
+	Cells are handed out in order of launch time, and their metrics are
+	filled in as each chunk of cells comes back.
+
+	system: System with G and other_bodies
+	launch_times: sequence of launch times, on the clock of the bodies
+	speeds: sequence of departure speeds relative to the earth
+	angles: sequence of departure angles, in radians from the earth's
+		direction of motion
+	targets: names of the bodies to measure closest approaches to
+	flight_time: how long each run lasts, defaults to whatever is left
+		of the bodies' ephemeris after the last launch
+	points: number of samples kept per run
+	earth: name of the body the runs launch from
+	processes: number of workers, defaults to the number of CPUs
+	directory: where to put the shared ephemeris file, created if needed
+	chunksize: cells per task, defaults to about 4 tasks per worker
+	options: passed along to run_trajectory (such as `threshold` or `rtol`)
+
+	returns: SweepFrame indexed by (launch, speed, angle), with the
+		altitude (from the surface) and flight time (from launch) of the
+		closest approach to each target, the final heliocentric speed
+		(NaN for runs that hit a body) and whether the run crashed (see
+		porkchop_columns)
+	"""
+	launch_times = np.asarray(launch_times, dtype=np.float64)
+	speeds = np.asarray(speeds, dtype=np.float64)
+	angles = np.asarray(angles, dtype=np.float64)
+
+	bodies = {body['name']: body for body in system.other_bodies}
+	ends = [body_positions(bodies[name]).index[-1] for name in (earth,) + tuple(targets)]
+	if flight_time is None:
+		flight_time = min(ends) - launch_times.max()
+	if launch_times.max() + flight_time > min(ends) or flight_time <= 0:
+		msg = f"""The ephemeris of {earth} and the targets ends at
+				 {min(ends)}, before the last launch at
+				 {launch_times.max()} plus a flight time of {flight_time}.
+				 Generate longer orbits (see `end` in main.py) or launch
+				 earlier."""
+		raise ValueError(msg)
+
+	flight_ts = np.linspace(0, flight_time, points)
+
+	index = pd.MultiIndex.from_product([launch_times, speeds, angles], names=['launch', 'speed', 'angle'])
+	tasks = list(enumerate(index))
+	columns = porkchop_columns(targets)
+	metrics = np.full((len(tasks), len(columns)), np.nan)
+
+	if processes is None:
+		processes = os.cpu_count()
+	if chunksize is None:
+		chunksize = max(1, len(tasks) // (4 * processes))
+
+	ephemeris_path = shared_path(directory, 'porkchop_ephemerides')
+	try:
+		specs = publish_bodies(system.other_bodies, ephemeris_path)
+		initargs = (ephemeris_path, specs, system.G, earth, tuple(targets), flight_ts, options)
+		with multiprocessing.Pool(processes, _init_worker, initargs) as pool:
+			for cell, row in pool.imap_unordered(_run_cell, tasks, chunksize=chunksize):
+				metrics[cell] = row
+	finally:
+		os.remove(ephemeris_path)
+
+	return SweepFrame(metrics, index=index, columns=columns)
+
+
+def porkchop_grid(sweep, column, angle=None):
+	"""One metric of a porkchop sweep as a 2-D grid, with departure
+	speeds down the rows and launch times across the columns, ready for
+	modsim_plot.contour.
+
+	sweep: SweepFrame from run_porkchop
+	column: name of the metric
+	angle: which departure angle to take, defaults to the only one
+
+	returns: SweepFrame
+	"""
+	series = sweep[column]
+	if angle is None:
+		angles = series.index.unique(level='angle')
+		if len(angles) != 1:
+			msg = f"""The sweep has {len(angles)} departure angles;
+					 pass the `angle` to plot."""
+			raise ValueError(msg)
+		angle = angles[0]
+
+	grid = series.xs(angle, level='angle').unstack('launch')
+	return SweepFrame(grid.values, index=grid.index, columns=grid.columns)
@@ -0,0 +1,420 @@
+"""
+Drawing the slingshot animation.
+
+The positions of every body at every frame are computed up front, in one
+vectorized call per body, so drawing a frame is only a matter of pointing
+the artists at slices of that table.
+"""
+
+import multiprocessing
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import numpy as np
+import matplotlib
+from matplotlib.animation import FFMpegWriter, FuncAnimation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import EllipseCollection
+from matplotlib.colors import to_rgba_array
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle
+
+# milliseconds between frames, so 5 frames per second when saved
+INTERVAL = 200
+
+
+def frame_positions(bodies, frames):
+	"""Positions of every body at every frame time.
+
+	Uses each body's position_interpolations, so runs that stopped at an
+	impact stay where they hit (see main.voyager_body).
+
+	bodies: list of body dictionaries
+	frames: array (f,) of times
+
+	returns: array (len(bodies), f, 2) of x, y
+	"""
+	frames = np.asarray(frames, dtype=np.float64)
+	table = np.empty((len(bodies), len(frames), 2))
+	for idx, body in enumerate(bodies):
+		interp = body['position_interpolations']
+		table[idx, :, 0] = interp['x'](frames)
+		table[idx, :, 1] = interp['y'](frames)
+	return table
+
+
+class UpdateRenderer:
+	"""
+	Animation function for `update` mode: each body is a circle that
+	moves along a trail of everywhere it has been.
+
+	UpdateRenderer: {
+		table: array (bodies, frames, 2), see frame_positions
+		circles: list of matplotlib Circles
+		lines: list of matplotlib Line2Ds
+	}
+
+	Pass it to FuncAnimation with the frame numbers as frames and
+	`init_func=renderer.init`; each call returns the artists it changed,
+	as blitting requires.
+	"""
+
+	def __init__(self, ax, table, colors, radii):
+		self.table = table
+		self.circles = []
+		self.lines = []
+		for idx, radius in enumerate(radii):
+			x, y = self.table[idx, 0]
+			circle = Circle((x, y), radius, color=colors[idx])
+			line, = ax.plot([], [], colors[idx])
+			ax.add_artist(circle)
+			self.circles.append(circle)
+			self.lines.append(line)
+
+		self.artists = self.circles + self.lines
+
+	def __len__(self):
+		return self.table.shape[1]
+
+	def init(self):
+		for line in self.lines:
+			line.set_data([], [])
+		return self.artists
+
+	def __call__(self, frame):
+		# the trails are the table up to this frame; set_data copies them,
+		# so each line holds one copy of its trail as it is now
+		trail = self.table[:, :frame + 1]
+		for idx, (circle, line) in enumerate(zip(self.circles, self.lines)):
+			circle.center = trail[idx, -1]
+			line.set_data(trail[idx, :, 0], trail[idx, :, 1])
+		return self.artists
+
+
+class TrailRenderer:
+	"""
+	Animation function for `trail` mode: every frame leaves a circle for
+	each body where it is, so the bodies draw out their paths.
+
+	TrailRenderer: {
+		table: array (bodies, frames, 2), see frame_positions
+		collection: one EllipseCollection holding every circle on screen
+		length: number of most recent frames whose circles are kept, or
+			None to keep them all, in which case every frame draws more
+			circles than the last
+		decimate: only every `decimate`th frame (counting from the first
+			frame) leaves a circle, besides the current one
+		fade: whether older circles fade out
+	}
+
+	The circles are all offsets of the single collection, which is reset
+	in place every frame, instead of one patch artist per body per frame.
+	Circles outside the `limit` viewport are skipped. Only with a `length`
+	does the cost of a frame stay the same however long the animation is;
+	by default it grows with the frame number.
+	"""
+
+	def __init__(self, ax, table, colors, radius=1e11, limit=None,
+				 length=None, decimate=1, fade=False):
+		self.table = table
+		self.length = length
+		self.decimate = decimate
+		self.fade = fade
+
+		if limit is None:
+			self.inside = np.ones(self.table.shape[:2], dtype=bool)
+		else:
+			self.inside = (np.abs(self.table) <= limit).all(axis=-1)
+
+		self.colors = to_rgba_array(colors[:len(table)])
+		self.collection = EllipseCollection(2 * radius, 2 * radius, 0, units='xy',
+											offsets=np.empty((0, 2)), offset_transform=ax.transData)
+		ax.add_collection(self.collection)
+
+	def __len__(self):
+		return self.table.shape[1]
+
+	def init(self):
+		self.collection.set_offsets(np.empty((0, 2)))
+		return [self.collection]
+
+	def __call__(self, frame):
+		first = 0 if self.length is None else max(0, frame - self.length + 1)
+
+		# frames that leave a circle are multiples of `decimate`, so a
+		# circle stays where it is once drawn; the current frame shows
+		# where the bodies are now
+		kept = np.arange(-(-first // self.decimate) * self.decimate, frame + 1, self.decimate)
+		if len(kept) == 0 or kept[-1] != frame:
+			kept = np.append(kept, frame)
+
+		inside = self.inside[:, kept]
+		offsets = self.table[:, kept][inside]
+		colors = np.broadcast_to(self.colors[:, None, :], inside.shape + (4,))[inside]
+
+		if self.fade:
+			span = self.length if self.length is not None else frame + 1
+			age = (frame - np.broadcast_to(kept, inside.shape)[inside]) / span
+			colors = colors.copy()
+			colors[:, 3] *= 1 - 0.9 * age
+
+		self.collection.set_offsets(offsets)
+		self.collection.set_facecolors(colors)
+		return [self.collection]
+
+
+def make_animation(table, mode, colors, limit, title=None, radii=None, radius=1e11,
+				   length=None, decimate=1, fade=False):
+	"""Figure and renderer for the position animation.
+
+	The figure is drawn with Agg directly, without going through pyplot,
+	so it can be made the same way in worker processes that have no
+	display.
+
+	table: array (bodies, frames, 2), see frame_positions
+	mode: 'update' or 'trail'
+	colors: list of colors, one per body
+	limit: half the width of the square viewport
+	title: string
+	radii: radius of each body's circle in `update` mode
+	radius, length, decimate, fade: passed along to TrailRenderer in
+		`trail` mode
+
+	returns: Figure, UpdateRenderer or TrailRenderer
+	"""
+	fig = Figure(figsize=(20, 20), dpi=100)
+	FigureCanvasAgg(fig)
+	ax = fig.add_subplot(xlim=(-limit, limit), ylim=(-limit, limit))
+	ax.set_title(title)
+
+	if mode == 'update':
+		renderer = UpdateRenderer(ax, table, colors, radii)
+	else:
+		renderer = TrailRenderer(ax, table, colors, radius=radius, limit=limit,
+								 length=length, decimate=decimate, fade=fade)
+	return fig, renderer
+
+
+def animate(fig, renderer, frames):
+	"""FuncAnimation over the given frame numbers.
+
+	The serial and parallel renders both go through this, so they draw
+	every frame the same way.
+	"""
+	return FuncAnimation(fig, renderer, frames, init_func=renderer.init, interval=INTERVAL, blit=True)
+
+
+# state of each worker process in render_parallel
+_worker = {}
+
+
+def _init_worker(table_path, mode, rc, options):
+	# under `spawn` the workers don't inherit the styling done by the
+	# parent, e.g. by seaborn, so it is applied again
+	matplotlib.rcParams.update(rc)
+	table = np.load(table_path, mmap_mode='r')
+	_worker['mode'] = mode
+	_worker['table'] = table
+	_worker['options'] = options
+
+
+def _render_chunk(task):
+	start, stop, path = task
+	fig, renderer = make_animation(_worker['table'], _worker['mode'], **_worker['options'])
+
+	# the segments are lossless, so stitching them loses nothing and
+	# the final encode sees exactly the frames a serial render would
+	writer = FFMpegWriter(fps=1000 / INTERVAL, codec='ffv1')
+	animate(fig, renderer, range(start, stop)).save(path, writer=writer)
+	return path
+
+
+def _output_args(filepath):
+	"""ffmpeg arguments for writing the animation to `filepath`."""
+	if filepath.endswith('.gif'):
+		return ['-filter_complex', 'split[a][b];[a]palettegen[p];[b][p]paletteuse', filepath]
+	return ['-vcodec', 'h264', '-pix_fmt', 'yuv420p', filepath]
+
+
+def stitch_segments(segments, filepath, fps=1000 / INTERVAL):
+	"""Joins video segments, in order, into one mp4 or GIF with ffmpeg.
+
+	mp4s are encoded with the same codec and pixel format as matplotlib's
+	FFMpegWriter uses for a serial render.
+
+	The list of segments is written to a file of its own next to
+	`filepath` for ffmpeg to read, and removed even if ffmpeg fails.
+
+	segments: list of video file paths
+	filepath: output path, ending in .mp4 or .gif
+	fps: frames per second
+	"""
+	name = os.path.splitext(os.path.basename(filepath))[0]
+	handle, listing = tempfile.mkstemp(suffix='.txt', prefix=f'{name}_segments_',
+									   dir=os.path.dirname(os.path.abspath(filepath)))
+	try:
+		with os.fdopen(handle, 'w') as file_handle:
+			for path in segments:
+				file_handle.write(f"file '{os.path.abspath(path)}'\n")
+
+		command = [matplotlib.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+				   '-f', 'concat', '-safe', '0', '-r', str(fps), '-i', listing]
+		subprocess.run(command + _output_args(filepath), check=True)
+	finally:
+		os.remove(listing)
+
+
+def render_parallel(filepath, table, mode, processes=None, directory='build', chunks_per_process=4, **options):
+	"""Renders the position animation in a pool of worker processes.
+
+	The frame range is split into contiguous chunks. Each worker draws its
+	chunks headlessly with Agg, from `table` published to a memory-mapped
+	file, and encodes each one as a lossless segment; the segments are
+	then stitched together with ffmpeg. The file and the segments are
+	kept in a temporary directory of their own inside `directory`, so
+	renders running at the same time don't overwrite each other's, and
+	it is removed when the render is done or fails. A frame only depends
+	on its own number (see UpdateRenderer and TrailRenderer), so the
+	result is the same as rendering the whole range in one process. There
+	are several chunks per worker because later frames in `trail` mode
+	take longer to draw.
+
+	filepath: output path, ending in .mp4 or .gif
+	table: array (bodies, frames, 2), see frame_positions
+	mode: 'update' or 'trail'
+	processes: number of workers, defaults to the number of CPUs
+	directory: where to put the temporary directory, created if needed
+	chunks_per_process: how many chunks to split the frames into per worker
+	options: passed along to make_animation
+	"""
+	processes = processes or os.cpu_count()
+	num_frames = table.shape[1]
+	num_chunks = max(1, min(num_frames, processes * chunks_per_process))
+	bounds = np.linspace(0, num_frames, num_chunks + 1).round().astype(int)
+
+	rc = {key: value for key, value in matplotlib.rcParams.items() if key != 'backend'}
+
+	os.makedirs(directory, exist_ok=True)
+	with tempfile.TemporaryDirectory(prefix='render_', dir=directory) as scratch:
+		table_path = os.path.join(scratch, 'positions.npy')
+		np.save(table_path, np.ascontiguousarray(table, dtype=np.float64))
+
+		tasks = [(start, stop, os.path.join(scratch, f'segment_{i}.mkv'))
+				 for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]))]
+		initargs = (table_path, mode, rc, options)
+
+		with multiprocessing.Pool(processes, _init_worker, initargs) as pool:
+			segments = list(pool.imap(_render_chunk, tasks, chunksize=1))
+
+		stitch_segments(segments, filepath)
+
+
+def have_ffmpeg():
+	"""Whether the ffmpeg that matplotlib is configured with can be found."""
+	return shutil.which(matplotlib.rcParams['animation.ffmpeg_path']) is not None
+
+
+class PipeWriter:
+	"""
+	Streams the frames of a figure drawn with Agg to one ffmpeg process,
+	as raw RGBA.
+
+	PipeWriter: {
+		fig: Figure being animated
+		process: the ffmpeg subprocess
+		thread: thread that writes frames to the process
+	}
+
+	grab_frame draws the figure and hands the canvas buffer, as a
+	memoryview, to the writer thread through a bounded queue, so the next
+	frame is drawn while ffmpeg encodes this one. Agg draws every frame
+	into the same buffer, so each one is copied once into one of a few
+	recycled buffers; when they are all waiting to be encoded, drawing
+	blocks until ffmpeg catches up. Unlike FFMpegWriter, no savefig call
+	is made per frame.
+	"""
+
+	def __init__(self, fig, filepath, fps=1000 / INTERVAL, buffers=3):
+		self.fig = fig
+		fig.canvas.draw()
+		width, height = fig.canvas.get_width_height()
+		nbytes = width * height * 4
+
+		command = [matplotlib.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+				   '-f', 'rawvideo', '-vcodec', 'rawvideo', '-s', f'{width}x{height}',
+				   '-pix_fmt', 'rgba', '-r', str(fps), '-i', 'pipe:']
+		self.process = subprocess.Popen(command + _output_args(filepath), stdin=subprocess.PIPE)
+
+		self._free = queue.Queue()
+		self._full = queue.Queue(maxsize=buffers)
+		for _ in range(buffers):
+			self._free.put(memoryview(bytearray(nbytes)))
+		self._error = None
+
+		self.thread = threading.Thread(target=self._write, daemon=True)
+		self.thread.start()
+
+	def _write(self):
+		while True:
+			buffer = self._full.get()
+			if buffer is None:
+				return
+			if self._error is None:
+				try:
+					self.process.stdin.write(buffer)
+				except OSError as error:
+					self._error = error
+			self._free.put(buffer)
+
+	def grab_frame(self):
+		"""Draws the figure and queues it to be encoded."""
+		self.fig.canvas.draw()
+		frame = self.fig.canvas.buffer_rgba()
+		buffer = self._free.get()
+		buffer[:] = frame.cast('B')
+		self._full.put(buffer)
+
+	def finish(self):
+		"""Waits for every queued frame to be encoded, and for ffmpeg to exit.
+
+		Raises CalledProcessError if ffmpeg failed.
+		"""
+		self._full.put(None)
+		self.thread.join()
+		try:
+			self.process.stdin.close()
+		except OSError:
+			pass
+		returncode = self.process.wait()
+		if returncode != 0 or self._error is not None:
+			raise subprocess.CalledProcessError(returncode, self.process.args)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.finish()
+		else:
+			self.process.kill()
+			self._full.put(None)
+			self.thread.join()
+			self.process.wait()
+
+
+def render_piped(filepath, fig, renderer, frames, buffers=3):
+	"""Renders the position animation through a PipeWriter.
+
+	filepath: output path, ending in .mp4 or .gif
+	fig, renderer: see make_animation
+	frames: frame numbers
+	buffers: how many drawn frames can wait to be encoded
+	"""
+	with PipeWriter(fig, filepath, buffers=buffers) as writer:
+		renderer.init()
+		for frame in frames:
+			renderer(frame)
+			writer.grab_frame()
@@ -0,0 +1,198 @@
+"""
+Running many voyager trajectories at once.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import numpy as np
+from modsim import State, System, TimeFrame, run_odeint, underride
+from gravity import ensemble_slope_func, run_trajectory
+from cache import ResultCache
+
+
+def run_ensemble(system, inits, **kwargs):
+	"""Integrates several projectiles together in one call to run_odeint.
+
+	The states are stacked into one vector of 4 * len(inits) components
+	and advanced with ensemble_slope_func, so the planet positions are
+	looked up once per step for the whole ensemble.
+
+	The members only interact through the shared time steps, so the
+	Jacobian is block diagonal and odeint is told it is banded. The error
+	test of odeint (LSODA) is a weighted max-norm, which holds each
+	component to the same tolerances as when it is integrated alone, so
+	the tolerances are odeint's usual ones. The steps are those the
+	hardest member needs, so no member takes longer steps than it would
+	on its own.
+
+	system: System with G, ts and other_bodies
+	inits: sequence of State objects with x, y, vx and vy
+	kwargs: passed along to odeint
+
+	returns: list of TimeFrames (one per member), boolean array of
+		crash flags (one per member)
+	"""
+	num = len(inits)
+	underride(kwargs, ml=3, mu=3)
+
+	stacked = {}
+	for i, init in enumerate(inits):
+		for name in ('x', 'y', 'vx', 'vy'):
+			stacked[f'{name}{i}'] = init[name]
+
+	system.init = State(**stacked)
+	system.ensemble_crashed = np.zeros(num, dtype=bool)
+	run_odeint(system, ensemble_slope_func, **kwargs)
+
+	array = system.results.values.reshape(len(system.results), num, 4)
+	results = [TimeFrame(array[:, i, :], columns=['x', 'y', 'vx', 'vy'], index=system.results.index)
+			   for i in range(num)]
+
+	return results, system.ensemble_crashed.copy()
+
+
+def publish_bodies(bodies, filepath):
+	"""Writes the trajectories of bodies to one .npy file that worker
+	processes can memory-map, instead of pickling them into every worker.
+
+	The file holds one float64 array with columns t, x, y, vx, vy, and
+	the rows of each sampled body one after the other. Bodies with an
+	ephemeris instead (see gravity.compress_body and
+	main.generate_kepler_planets) aren't sampled: their ephemeris, which
+	is only a few coefficients or orbital elements, goes in their spec,
+	so the workers evaluate the same ephemeris as everyone else.
+
+	bodies: list of body dictionaries (see projectile_slope_func)
+	filepath: where to write the array
+
+	returns: list of dictionaries, one per body, with its other `fields`
+		(name, mass, radius, ...) and either the [start, stop) `rows` of
+		its trajectory or its `ephemeris`
+	"""
+	specs = []
+	columns = [np.empty((0, 5))]
+	start = 0
+	for body in bodies:
+		spec = {"fields": {key: value for key, value in body.items()
+						   if key not in ('positions', 'position_interpolations', 'ephemeris')}}
+		if 'positions' in body:
+			positions = body['positions']
+			spec["rows"] = (start, start + len(positions))
+			columns.append(np.column_stack([positions.index, positions[['x', 'y', 'vx', 'vy']].values]))
+			start += len(positions)
+		else:
+			spec["ephemeris"] = body['ephemeris']
+		specs.append(spec)
+
+	np.save(filepath, np.concatenate(columns).astype(np.float64))
+	return specs
+
+
+def mapped_bodies(filepath, specs):
+	"""Memory-maps bodies written by publish_bodies.
+
+	returns: list of body dictionaries with the fields of each body and
+		either its positions or its ephemeris
+	"""
+	mapped = np.load(filepath, mmap_mode='r')
+	bodies = []
+	for spec in specs:
+		body = dict(spec['fields'])
+		if 'rows' in spec:
+			rows = mapped[spec['rows'][0]:spec['rows'][1]]
+			body['positions'] = TimeFrame(rows[:, 1:], index=rows[:, 0], columns=['x', 'y', 'vx', 'vy'])
+		else:
+			body['ephemeris'] = spec['ephemeris']
+		bodies.append(body)
+	return bodies
+
+
+def shared_path(directory, name):
+	"""A new, empty .npy file in `directory` (created if needed) for
+	worker processes to share. The name is unique, so sweeps running at
+	the same time in the same directory don't overwrite each other's
+	files; whoever asks for it removes it when done.
+
+	returns: path of the file
+	"""
+	os.makedirs(directory, exist_ok=True)
+	handle, path = tempfile.mkstemp(suffix='.npy', prefix=f'{name}_', dir=directory)
+	os.close(handle)
+	return path
+
+
+# state of each worker process in run_parallel
+_worker = {}
+
+
+def _init_worker(ephemeris_path, specs, G, ts, results_path, cache_options):
+	system = System(init=None, G=G, ts=ts)
+	system.other_bodies = mapped_bodies(ephemeris_path, specs)
+
+	_worker['system'] = system
+	_worker['cache'] = ResultCache(**cache_options) if cache_options is not None else None
+	_worker['results'] = np.load(results_path, mmap_mode='r+')
+
+
+def _run_member(task):
+	i, (x, y, vx, vy) = task
+	system = _worker['system']
+	system.init = State(x=x, y=y, vx=vx, vy=vy)
+
+	impact = run_trajectory(system, cache=_worker['cache'])
+	rows = len(system.results)
+	_worker['results'][i, :rows] = system.results.values
+
+	return rows, impact
+
+
+def run_parallel(system, inits, processes=None, directory='build', cache=None):
+	"""Integrates each projectile on its own in a pool of worker processes.
+
+	The trajectories of `system.other_bodies` are published once to a
+	memory-mapped file in `directory` (see publish_bodies), and each
+	worker writes its results straight into a second mapped file, so
+	neither the ephemerides nor the results are pickled between
+	processes. Both files are removed once the results are read back.
+	Runs are handed out one at a time, so a worker whose run crashes
+	early picks up the next run.
+
+	system: System with G, ts and other_bodies
+	inits: sequence of State objects with x, y, vx and vy
+	processes: number of workers, defaults to the number of CPUs
+	directory: where to put the shared files, created if needed
+	cache: optional ResultCache; each worker opens the same cache directory
+
+	returns: list of TimeFrames (one per member, in the order of `inits`,
+		cut short at the impact for runs that crash), list of impacts
+		(see run_trajectory)
+	"""
+	ephemeris_path = shared_path(directory, 'sweep_ephemerides')
+	results_path = shared_path(directory, 'sweep_results')
+
+	try:
+		specs = publish_bodies(system.other_bodies, ephemeris_path)
+		shape = (len(inits), len(system.ts), 4)
+		np.lib.format.open_memmap(results_path, mode='w+', dtype=np.float64, shape=shape).flush()
+
+		tasks = [(i, (init.x, init.y, init.vx, init.vy)) for i, init in enumerate(inits)]
+		cache_options = None
+		if cache is not None:
+			cache_options = {"directory": cache.directory, "max_bytes": cache.max_bytes}
+		initargs = (ephemeris_path, specs, system.G, np.asarray(system.ts), results_path, cache_options)
+
+		with multiprocessing.Pool(processes, _init_worker, initargs) as pool:
+			outcomes = list(pool.imap(_run_member, tasks, chunksize=1))
+
+		# the TimeFrames copy their rows out of the file, so it can go
+		array = np.load(results_path, mmap_mode='r')
+		results = [TimeFrame(array[i, :rows], columns=['x', 'y', 'vx', 'vy'], index=system.ts[:rows], copy=True)
+				   for i, (rows, _) in enumerate(outcomes)]
+		del array
+	finally:
+		os.remove(ephemeris_path)
+		os.remove(results_path)
+
+	impacts = [impact for _, impact in outcomes]
+	return results, impacts
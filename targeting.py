@@ -0,0 +1,201 @@
+"""
+Searching launch conditions for a flyby, instead of sweeping a fixed grid
+of them and picking the best run by eye.
+"""
+
+import math
+import numpy as np
+from modsim import SweepSeries, linspace, max_bounded, min_bounded, underride
+from gravity import body_states, periapsis_event, run_trajectory
+
+
+def bracket_and_optimize(func, bounds, num=7, maximize=False, **options):
+	"""Finds the input within `bounds` that minimizes (or maximizes) `func`.
+
+	`func` is first evaluated at `num` evenly spaced inputs to find the
+	basin of the best one, then min_bounded (or max_bounded) narrows it
+	down between that input's neighbors. No input is evaluated twice.
+
+	`func` may return inf (or -inf when maximizing) for inputs where it
+	failed; they are never the best, and min_bounded steps around them.
+
+	func: function of one number
+	bounds: sequence of two values, lower and upper bounds
+	num: number of inputs in the first scan, at least 3
+	maximize: whether to maximize instead of minimize
+	options: passed along to min_bounded or max_bounded
+
+	returns: OptimizeResult (see min_bounded) with an extra `evaluations`,
+		a SweepSeries of the value at every input func was evaluated at,
+		and `nfev`, the number of evaluations
+	"""
+	evaluations = {}
+
+	def memo(x):
+		x = float(x)
+		if x not in evaluations:
+			evaluations[x] = func(x)
+		return evaluations[x]
+
+	xs = linspace(bounds[0], bounds[1], num)
+	values = [memo(x) for x in xs]
+	best = int(np.argmax(values) if maximize else np.argmin(values))
+	bracket = (xs[max(best - 1, 0)], xs[min(best + 1, num - 1)])
+
+	# a parabola through an infinite value is NaN, which makes
+	# minimize_scalar take a golden-section step instead
+	optimize = max_bounded if maximize else min_bounded
+	with np.errstate(invalid='ignore'):
+		res = optimize(memo, bracket, **options)
+
+	res.evaluations = SweepSeries(evaluations).sort_index()
+	res.nfev = len(evaluations)
+	return res
+
+
+class FlybyCutoff:
+	"""
+	Terminal event function used by target_flyby. It stops a run once
+	the run can no longer beat `best`.
+
+	FlybyCutoff: {
+		best: num, miss distance of the best run so far
+	}
+
+	The run's closest approach to a target is at most its distance now,
+	so a target that is closer than its desired altitude adds at least
+	the shortfall to the run's final miss. The sum of the shortfalls is
+	a lower bound on that miss, and the event crosses zero, going down,
+	when the bound passes `best`. It only depends on the state and time,
+	like any other event function, so solve_ivp can locate it.
+
+	A target that is farther than its altitude adds nothing to the bound:
+	the run can always still come closer to it. So for grazing flybys
+	(altitudes of 0) there is no bound, and target_flyby doesn't watch
+	for this event at all.
+	"""
+	terminal = True
+	direction = -1
+
+	def __init__(self, targets, altitudes, best=math.inf):
+		self.__name__ = 'flyby_cutoff'
+		self.best = best
+		self._states = [body_states(body) for body in targets]
+		self._radius = [body['radius'] for body in targets]
+		self._altitudes = altitudes
+
+	def __call__(self, state, t, system):
+		shortfall = 0.0
+		for states, radius, altitude in zip(self._states, self._radius, self._altitudes):
+			x, y = states(t)[:2]
+			shortfall += max(altitude - (math.hypot(state[0] - x, state[1] - y) - radius), 0.0)
+		return min(self.best - shortfall, 1.0)
+
+
+def closest_approaches(system, targets):
+	"""Closest distance from the projectile to the surface of each target
+	during the last run of `system`, and when it happened.
+
+	The samples in system.results are combined with the periapsis and
+	collision events of the run (see periapsis_event), which pin down the
+	closest approach between samples.
+
+	system: System after run_trajectory
+	targets: list of body dictionaries
+
+	returns: array of distances, array of times
+	"""
+	results = system.results
+	ts = np.asarray(results.index, dtype=np.float64)
+	events = system.events
+
+	distances = np.empty(len(targets))
+	times = np.empty(len(targets))
+	for i, body in enumerate(targets):
+		rows = events[events.event.isin([f'periapsis_{body["name"]}', 'collision_event'])]
+		t = np.concatenate([ts, rows.t.values.astype(np.float64)])
+		x = np.concatenate([results.x.values, rows.x.values.astype(np.float64)])
+		y = np.concatenate([results.y.values, rows.y.values.astype(np.float64)])
+
+		positions = body_states(body)(t)
+		distance = np.hypot(x - positions[:, 0], y - positions[:, 1]) - body['radius']
+		closest = np.argmin(distance)
+		distances[i] = max(distance[closest], 0.0)
+		times[i] = t[closest]
+
+	return distances, times
+
+
+def target_flyby(system, make_init, bounds, targets, altitudes=None, num=7, cache=None, **options):
+	"""Searches for the launch parameter that brings the projectile
+	closest to the given altitudes above one or more bodies.
+
+	The miss distance is the sum, over the targets, of how far the
+	closest approach is from the desired altitude. It is minimized with
+	bracket_and_optimize. A run that hits any body is a failure, not a
+	miss of 0, and counts as an infinite miss; it stops at the impact.
+
+	When some altitudes are above 0, a run of the first scan (where only
+	the best run matters) that passes so far inside them that it
+	provably can't beat the best one so far is stopped early too (see
+	FlybyCutoff), and also counts as an infinite miss. The runs of the
+	optimization after the scan are integrated to the end or to impact,
+	so the optimizer only sees true miss distances and failures.
+
+	system: System with G, ts and other_bodies
+	make_init: function that maps the launch parameter to a State
+	bounds: sequence of two values, lower and upper bounds of the parameter
+	targets: names of bodies in system.other_bodies
+	altitudes: desired closest distance from the surface of each target,
+		defaults to 0 (grazing)
+	num: number of runs in the first scan (see bracket_and_optimize)
+	cache: optional ResultCache (see run_trajectory)
+	options: passed along to min_bounded; xatol defaults to 1e-4 of the
+		width of `bounds`
+
+	returns: OptimizeResult with the best parameter `x` of all the
+		runs, its miss distance `fun`, `evaluations` (inf for runs that
+		crashed or were stopped early) and `nfev` (see
+		bracket_and_optimize), and the `closest` approaches and their
+		`times` for the best run
+	"""
+	bodies = {body['name']: body for body in system.other_bodies}
+	targets = [bodies[name] for name in targets]
+	altitudes = np.zeros(len(targets)) if altitudes is None else np.asarray(altitudes, dtype=np.float64)
+
+	events = [periapsis_event(body) for body in targets]
+	best = {"miss": math.inf, "runs": 0}
+
+	def miss_distance(param):
+		# bracket_and_optimize starts with a scan of `num` inputs, where
+		# only which run is best matters, so only those runs are cut off
+		best["runs"] += 1
+		scanning = best["runs"] <= num and (altitudes > 0).any()
+
+		system.init = make_init(param)
+		cutoff = [FlybyCutoff(targets, altitudes, best["miss"])] if scanning else []
+		impact = run_trajectory(system, events=events + cutoff, cache=cache)
+
+		if impact is not None or (system.events.event == 'flyby_cutoff').any():
+			return math.inf
+
+		closest, times = closest_approaches(system, targets)
+		miss = np.abs(closest - altitudes).sum()
+		if miss < best["miss"]:
+			best.update(param=param, miss=miss, closest=closest, times=times)
+		return miss
+
+	underride(options, xatol=1e-4 * (bounds[1] - bounds[0]))
+	res = bracket_and_optimize(miss_distance, bounds, num=num, **options)
+
+	if "param" not in best:
+		msg = f"""Every one of the {res.nfev} runs between {bounds[0]}
+				 and {bounds[1]} hit a body. Try other bounds."""
+		raise ValueError(msg)
+
+	# the first scan may have found a better run outside the bracket
+	res.x = best["param"]
+	res.fun = best["miss"]
+	res.closest = best["closest"]
+	res.times = best["times"]
+	return res
@@ -0,0 +1,71 @@
+"""
+Extending a checkpointed run (see checkpoint.run_segmented) with planets
+regenerated over the longer time span.
+
+$ python -m pytest test_checkpoint.py
+"""
+
+import numpy as np
+import pytest
+from modsim import State, System, TimeFrame, run_odeint
+from gravity import projectile_slope_func, run_trajectory
+from checkpoint import read_manifest
+
+G = 6.67408e-11
+AU = 1.496e11
+SPACING = 1293840000 / 9999
+
+sun_frame = TimeFrame({"x": 0, "y": 0, "vx": 0, "vy": 0}, [0, 1])
+sun = {"name": 'sun', "mass": 1.989e30, "radius": 695700e3, "positions": sun_frame}
+
+
+def planet(name, distance, mass, radius, ts):
+	"""Integrates a planet around the sun over `ts`, as main.generate_planet_orbit does."""
+	speed = np.sqrt(G * sun['mass'] / distance)
+	system = System(init=State(x=distance, y=0.0, vx=0.0, vy=speed), G=G, ts=ts)
+	system.other_bodies = [sun]
+	run_odeint(system, projectile_slope_func)
+	return {"name": name, "mass": mass, "radius": radius, "positions": system.results}
+
+
+def make_system(num):
+	"""A system over `num` samples, with planets generated over them."""
+	ts = SPACING * np.arange(num)
+	system = System(init=None, G=G, ts=ts)
+	system.other_bodies = [
+		planet('earth', AU, 5.972e24, 6371e3, ts),
+		planet('jupiter', 5.2 * AU, 1.898e27, 69911e3, ts),
+		sun,
+	]
+	system.init = State(x=AU + 1e7, y=0.0, vx=0.0, vy=40e3)
+	return system
+
+
+def test_extend_with_regenerated_planets(tmp_path):
+	directory = str(tmp_path / 'voyager')
+
+	short = make_system(500)
+	run_trajectory(short, checkpoint=directory, window=200)
+	assert read_manifest(directory)["rows"] == 500
+
+	# the planets are regenerated over the longer ts, as with `end=YEAR`
+	long = make_system(1000)
+	run_trajectory(long, checkpoint=directory, window=200)
+	assert read_manifest(directory)["rows"] == 1000
+	np.testing.assert_array_equal(long.results.index.values, long.ts)
+
+	continuous = make_system(1000)
+	run_trajectory(continuous)
+	error = np.abs(long.results.values - continuous.results.values).max(axis=0)
+	scale = np.abs(continuous.results.values).max(axis=0)
+	assert (error / scale < 1e-5).all()
+
+
+def test_moved_planets_are_rejected(tmp_path):
+	directory = str(tmp_path / 'voyager')
+	run_trajectory(make_system(500), checkpoint=directory, window=200)
+
+	moved = make_system(1000)
+	moved.other_bodies[1] = planet('jupiter', 5.3 * AU, 1.898e27, 69911e3, moved.ts)
+	with pytest.raises(ValueError):
+		run_trajectory(moved, checkpoint=directory, window=200)
@@ -0,0 +1,40 @@
+"""
+Searching for a grazing flyby (see targeting.target_flyby) next to launch
+parameters that hit the target.
+
+$ python -m pytest test_targeting.py
+"""
+
+import math
+import numpy as np
+from modsim import State, System, TimeFrame
+from gravity import run_trajectory
+from targeting import target_flyby
+
+G = 6.67408e-11
+DISTANCE = 1e9
+RADIUS = 1e7
+SPEED = 1e4
+
+# a moon that stays put, straight ahead of the launch
+moon_frame = TimeFrame({"x": DISTANCE, "y": 0.0, "vx": 0.0, "vy": 0.0}, [0, 1e6])
+moon = {"name": 'moon', "mass": 1e22, "radius": RADIUS, "positions": moon_frame}
+
+
+def launch(angle):
+	"""Leaving the origin at SPEED, `angle` radians off the line to the moon."""
+	return State(x=0.0, y=0.0, vx=SPEED * math.cos(angle), vy=SPEED * math.sin(angle))
+
+
+def test_grazing_flyby_does_not_crash():
+	system = System(init=None, G=G, ts=np.linspace(0, 2 * DISTANCE / SPEED, 200), other_bodies=[moon])
+
+	res = target_flyby(system, launch, (-0.05, 0.05), ['moon'])
+
+	# launching straight at the moon is a miss of 0 before it is a crash
+	assert math.isinf(res.evaluations[0.0])
+
+	system.init = launch(res.x)
+	assert run_trajectory(system) is None
+	assert 0 < res.fun < 0.01 * RADIUS
+	assert res.closest[0] == res.fun